@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from ingestion import read_dataset
+from preprocessor import preprocess_data, perform_pre_training_eda, compact_dtypes
+from trainer import train_models
+from evaluator import evaluate_models
+from model_selector import select_and_save_best_model
+from config import COMPACT_DTYPES
+
+BASELINE_PATH = os.path.join("benchmarks", "baseline.json")
+
+# Synthetic dataset sizes: rows, numeric and categorical feature columns,
+# categories per categorical column and fraction of cells left empty.
+SCALES = {
+    "small": {"n_rows": 2_000, "n_numeric": 8, "n_categorical": 4, "cardinality": 8, "missing_rate": 0.01},
+    "medium": {"n_rows": 50_000, "n_numeric": 20, "n_categorical": 8, "cardinality": 30, "missing_rate": 0.02},
+    "large": {"n_rows": 500_000, "n_numeric": 40, "n_categorical": 12, "cardinality": 100, "missing_rate": 0.02},
+}
+TASKS = ("classification", "regression")
+
+# Stages faster or smaller than this are too noisy to flag as regressions
+MIN_SECONDS = 0.05
+MIN_PEAK_MB = 10
+
+
+def make_synthetic_csv(file_path, task, n_rows, n_numeric, n_categorical, cardinality, missing_rate,
+                       random_state=42):
+    """
+    Writes a CSV with numeric and categorical features and a target in the last column
+    that depends on both, so models have something to learn.
+    Returns: file_path
+    """
+    rng = np.random.RandomState(random_state)
+    data = {f"num_{i}": rng.randn(n_rows) for i in range(n_numeric)}
+    for i in range(n_categorical):
+        data[f"cat_{i}"] = np.char.add("c", rng.randint(0, cardinality, n_rows).astype(str))
+    df = pd.DataFrame(data)
+
+    signal = df.filter(like="num_").to_numpy().dot(rng.randn(n_numeric)) if n_numeric else np.zeros(n_rows)
+    if n_categorical:
+        effects = dict(zip((f"c{k}" for k in range(cardinality)), rng.randn(cardinality)))
+        signal += df["cat_0"].map(effects).to_numpy()
+    signal += rng.randn(n_rows) * 0.5
+
+    # Missing cells are spread over the features; the target is always present
+    if missing_rate:
+        mask = rng.random_sample(df.shape) < missing_rate
+        df = df.mask(mask)
+
+    if task == "classification":
+        df["target"] = np.where(signal > np.median(signal), "yes", "no")
+    else:
+        df["target"] = signal
+
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    df.to_csv(file_path, index=False)
+    return file_path
+
+
+def measure(func, *args, **kwargs):
+    """
+    Calls func and records its wall time and the peak Python/numpy memory it
+    allocated (tracemalloc; memory held by native libraries outside numpy, or
+    by worker processes such as the EDA chart renderers, is not seen).
+    Returns: result, {"seconds": ..., "peak_mb": ...}
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {"seconds": round(seconds, 4), "peak_mb": round(peak / 1024 ** 2, 2)}
+
+
+def run_case(task, scale, random_state=42, compact=COMPACT_DTYPES, overrides=None):
+    """
+    Benchmarks every pipeline stage on one synthetic dataset.
+    Runs in a scratch directory so the benchmark's data, charts, reports and
+    models never mix with real ones. compact is passed to preprocess_data.
+    overrides replaces some of the scale's settings (keys as in SCALES).
+    Returns: dict of stage name -> {"seconds", "peak_mb"}
+    """
+    params = {**SCALES[scale], **(overrides or {})}
+    dataset_name = f"bench_{task}_{scale}"
+    stages = {}
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            file_path = make_synthetic_csv(os.path.join("data", f"{dataset_name}.csv"), task,
+                                           random_state=random_state, **params)
+            df = read_dataset(file_path)
+            if compact:
+                df = compact_dtypes(df, exclude=[df.columns[-1]])
+            df = df.dropna()
+
+            # Draw the charts first from the frame preprocess_data will hand its
+            # own EDA call (same dtypes, so the same hashes): that call then finds
+            # them in the manifest, so its timing covers preprocessing only
+            _, stages["perform_pre_training_eda"] = measure(perform_pre_training_eda, df, dataset_name)
+            (X, y, pipeline), stages["preprocess_data"] = measure(
+                preprocess_data, file_path, return_pipeline=True, dataset_name=dataset_name, compact=compact
+            )
+            trained_models, stages["train_models"] = measure(train_models, X, y, dataset_name)
+            results, stages["evaluate_models"] = measure(evaluate_models, trained_models, dataset_name, "benchmark")
+            _, stages["select_and_save_best_model"] = measure(select_and_save_best_model, results, pipeline)
+        finally:
+            os.chdir(cwd)
+
+    return stages
+
+
+def run_benchmarks(scales=("small",), tasks=TASKS, compact=COMPACT_DTYPES, overrides=None):
+    """
+    Runs run_case for every task at every scale, with overrides applied to each scale.
+    Cases run with overrides are named after them too, e.g. "regression-small[n_rows=10000]",
+    so they are only compared against baselines run with the same settings.
+    Returns: dict in the baseline file layout
+    """
+    overrides = overrides or {}
+    suffix = f"[{','.join(f'{key}={value}' for key, value in overrides.items())}]" if overrides else ""
+    results = {}
+    for scale in scales:
+        for task in tasks:
+            print(f"\nBenchmarking {task} at scale '{scale}' with {({**SCALES[scale], **overrides})}...")
+            results[f"{task}-{scale}{suffix}"] = run_case(task, scale, compact=compact, overrides=overrides)
+
+    return {
+        "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "compact_dtypes": compact,
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2):
+    """
+    Compares two benchmark runs stage by stage.
+    A stage regresses when its time or peak memory grew by more than tolerance
+    (0.2 = 20%); times under MIN_SECONDS and peaks under MIN_PEAK_MB are ignored as noise.
+    Returns: list of regression messages (empty if none)
+    """
+    regressions = []
+    for case, stages in current["results"].items():
+        for stage, now in stages.items():
+            before = baseline["results"].get(case, {}).get(stage)
+            if before is None:
+                continue
+            if max(now["seconds"], before["seconds"]) >= MIN_SECONDS and \
+                    now["seconds"] > before["seconds"] * (1 + tolerance):
+                regressions.append(f"{case} {stage}: {before['seconds']:.2f}s -> {now['seconds']:.2f}s")
+            if max(now["peak_mb"], before["peak_mb"]) >= MIN_PEAK_MB and \
+                    now["peak_mb"] > before["peak_mb"] * (1 + tolerance):
+                regressions.append(f"{case} {stage}: {before['peak_mb']:.1f} MB -> {now['peak_mb']:.1f} MB peak")
+    return regressions
+
+
+def print_table(run):
+    print(f"\n{'Case':<28} {'Stage':<28} {'Seconds':>10} {'Peak MB':>10}")
+    for case, stages in run["results"].items():
+        for stage, stats in stages.items():
+            print(f"{case:<28} {stage:<28} {stats['seconds']:>10.3f} {stats['peak_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the AutoML pipeline on synthetic data.")
+    parser.add_argument("--scale", nargs="+", default=["small"], choices=list(SCALES), help="Dataset sizes to run")
+    parser.add_argument("--task", nargs="+", default=list(TASKS), choices=list(TASKS), help="Problem types to run")
+    parser.add_argument("--output", default=BASELINE_PATH, help="Where to write the results (JSON)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline JSON to check this run against")
+    parser.add_argument("--rows", dest="n_rows", type=int, help="Rows, overriding the scale's")
+    parser.add_argument("--numeric", dest="n_numeric", type=int, help="Numeric feature columns, overriding the scale's")
+    parser.add_argument("--categorical", dest="n_categorical", type=int,
+                        help="Categorical feature columns, overriding the scale's")
+    parser.add_argument("--cardinality", type=int, help="Categories per categorical column, overriding the scale's")
+    parser.add_argument("--missing-rate", dest="missing_rate", type=float,
+                        help="Fraction of cells left empty, overriding the scale's")
+    parser.add_argument("--no-compact", action="store_true", help="Preprocess in float64 (see COMPACT_DTYPES)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown/memory growth (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    overrides = {key: getattr(args, key) for key in SCALES["small"] if getattr(args, key) is not None}
+    run = run_benchmarks(args.scale, args.task, compact=COMPACT_DTYPES and not args.no_compact, overrides=overrides)
+    print_table(run)
+
+    # Comparing never overwrites the baseline it compares against
+    output = args.output
+    if args.compare and os.path.abspath(output) == os.path.abspath(args.compare):
+        output = os.path.splitext(args.compare)[0] + "_latest.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(run, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
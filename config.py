@@ -89,4 +89,130 @@ DATASET_SOURCES = [
         "type": "csv",
         "goal": "Classify penguin species based on physical measurements"
     }
-]
\ No newline at end of file
+]
+
+# Number of dataset pipelines run_agent executes at once.
+# None uses one worker per CPU core.
+MAX_WORKERS = None
+
+# Dataset downloads: parallel connections, per-request timeout (seconds)
+# and how many times a failed request is retried with backoff.
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_RETRIES = 3
+
+# Rows per chunk for out-of-core preprocessing, and the file size above
+# which run_agent switches to it.
+PREPROCESS_CHUNK_SIZE = 100_000
+STREAMING_THRESHOLD_MB = 500
+
+# Wall-clock seconds train_models may spend on one dataset; candidates that
+# haven't finished by then are skipped. None means no limit.
+TRAINING_TIME_BUDGET = None
+
+# Successive-halving hyperparameter search in train_models: total seconds per
+# dataset (None disables the search), configurations sampled per model family,
+# and the factor by which each rung cuts candidates and grows the sample.
+SEARCH_TIME_BUDGET = None
+SEARCH_CANDIDATES = 27
+SEARCH_FACTOR = 3
+
+# Learning-curve racing in train_models: candidates are fitted on growing
+# fractions of the training split and scored on a held-out fold each round;
+# one whose per-row losses are worse than the leader's in a paired t-test at
+# RACING_ALPHA is dropped. The last fraction is the survivors' full fit.
+# Rounds with fewer than RACING_MIN_ROWS rows are skipped.
+RACING = True
+RACING_FRACTIONS = (0.05, 0.2, 1.0)
+RACING_ALPHA = 0.05
+RACING_MIN_ROWS = 100
+
+# Histogram gradient boosting candidate: most boosting iterations (early
+# stopping on a validation fraction usually ends far sooner), and the quantile
+# bins per feature of the binned copy shared by all its fits (at most 255).
+HGB_MAX_ITER = 500
+HGB_MAX_BINS = 255
+
+# Pre-training EDA: processes used to render charts (None = one per core),
+# and the row count above which histograms/KDE and the heatmap are drawn
+# from a sample of EDA_SAMPLE_ROWS rows.
+EDA_WORKERS = None
+EDA_FAST_MODE_ROWS = 200_000
+EDA_SAMPLE_ROWS = 50_000
+
+# Worker processes the dashboard's background job runner uses for AutoML runs.
+JOB_WORKERS = 2
+
+# Saved model artifacts: joblib compression level (0 disables).
+MODEL_COMPRESS = 3
+
+# Large-dataset mode (large_data.py): seconds the sample phase (EDA, model
+# screening and selection) may take, the most rows it will sample, and the
+# rows used for the pilot fit that sizes the sample to that budget.
+LARGE_DATA_TIME_BUDGET = 300
+LARGE_DATA_MAX_SAMPLE = 200_000
+LARGE_DATA_PILOT_ROWS = 2000
+
+# Categorical encoding in preprocess_data: "dense" (pd.get_dummies), "sparse"
+# or "auto", which goes sparse once one-hot encoding would add
+# SPARSE_MIN_DUMMIES columns. In the sparse encoding, columns with up to
+# ONEHOT_MAX_CARDINALITY categories are one-hot encoded and wider ones are
+# hashed into HASH_WIDTH columns.
+ENCODING = "auto"
+SPARSE_MIN_DUMMIES = 100
+ONEHOT_MAX_CARDINALITY = 32
+HASH_WIDTH = 64
+
+# Compact dtypes in preprocess_data: numeric columns are downcast on ingest
+# (integers to the smallest type that holds them, floats to float32), string
+# columns with fewer distinct values than COMPACT_CATEGORY_RATIO of the rows
+# become category, and the feature matrix is float32. False keeps float64.
+COMPACT_DTYPES = True
+COMPACT_CATEGORY_RATIO = 0.5
+
+# Feature screening in preprocess_data, before encoding: constant and ID-like
+# columns are dropped; string columns with more distinct values than
+# SCREEN_UNIQUE_RATIO of the rows keep only categories seen in at least
+# SCREEN_MIN_CATEGORY_ROWS rows (the rest share one bucket), or are dropped if
+# none is that common; of two numeric features correlated beyond
+# SCREEN_MAX_CORRELATION, the one less correlated with a numeric target goes.
+# With SCREEN_MAX_FEATURES set, only that many encoded features are kept,
+# ranked by a univariate F-test against the target.
+SCREENING = True
+SCREEN_UNIQUE_RATIO = 0.5
+SCREEN_MIN_CATEGORY_ROWS = 10
+SCREEN_MAX_CORRELATION = 0.95
+SCREEN_MAX_FEATURES = None
+
+# Directory for per-stage cProfile dumps of traced runs (see tracing.py); None
+# disables profiling. Dashboard jobs are always traced, to jobs/traces/.
+TRACE_PROFILE_DIR = None
+
+# Size cap of the stage cache (stage_cache.py) that lets re-runs skip unchanged
+# preprocessing, training and evaluation; least recently used entries go first.
+STAGE_CACHE_MAX_MB = 2048
+
+# Incremental updates (incremental.py): largest shift of a feature's mean, in
+# training standard deviations, and largest fraction of new rows with unseen
+# categories before a full retrain; rows kept to replay when warm-starting
+# linear classifiers; and how far (as a multiple of the original count)
+# forests may grow by adding trees before being refit from scratch.
+INCREMENTAL_DRIFT_THRESHOLD = 0.5
+INCREMENTAL_NEW_CATEGORY_RATE = 0.05
+INCREMENTAL_REPLAY_ROWS = 5000
+INCREMENTAL_MAX_TREE_GROWTH = 2.0
+
+# Local prediction server (serve.py): bind address, and how many rows or
+# milliseconds a micro-batch may collect before its predict call runs.
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8000
+SERVE_MAX_BATCH_ROWS = 256
+SERVE_MAX_WAIT_MS = 2
+
+# Per-run workspaces (workspace.py): each pipeline run writes its charts,
+# report and model under RUNS_DIR/<dataset>/<run id>/. cleanup_runs deletes
+# runs older than RUN_MAX_AGE_DAYS, then the oldest until all runs fit in
+# RUN_MAX_TOTAL_MB; a dataset's latest run is always kept.
+RUNS_DIR = "runs"
+RUN_MAX_AGE_DAYS = 30
+RUN_MAX_TOTAL_MB = 4096
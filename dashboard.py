@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
 import os
-import tempfile
-import shutil
-import joblib
+from pathlib import Path
+import hashlib
 
-from preprocessor import preprocess_data
-from trainer import train_models
-from evaluator import evaluate_models
-from model_selector import select_and_save_best_model
+from ingestion import read_dataset, read_head, file_hash
+from job_queue import submit_job, list_jobs, get_job, get_events, trace_path_for
+from tracing import read_trace, summarize
+from model_registry import list_models
+from workspace import output_paths, load_run, atomic_path
 
 # -------------------- Page config --------------------
 st.set_page_config(page_title="AutoML Dashboard - Upload & Train", layout="wide")
@@ -30,28 +30,67 @@ MAX_COLUMNS = 20
 MAX_ROWS = 5000
 MAX_FILE_SIZE_MB = 15
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+UPLOAD_TYPES = ["csv", "tsv", "txt", "data", "gz", "bz2", "zip", "parquet"]
+# Large-dataset mode only reads this many rows in the UI (preview and target choice)
+PREVIEW_ROWS = 1000
+
+
+# -------------------- Cached stages --------------------
+# Streamlit reruns this script on every widget interaction. Everything below is
+# keyed by the dataset's content hash, so a rerun with the same data is free.
+@st.cache_data(show_spinner=False)
+def load_dataset(path, content_hash):
+    return read_dataset(path)
+
+
+@st.cache_data(show_spinner=False)
+def load_preview(path, content_hash):
+    return read_head(path, PREVIEW_ROWS)
+
 
 # -------------------- Upload CSV --------------------
-st.sidebar.markdown(f"### Upload a CSV dataset (Max {MAX_FILE_SIZE_MB} MB)")
-uploaded_file = st.sidebar.file_uploader("Drag and drop file here", type=["csv"])
+large_mode = st.sidebar.checkbox(
+    "Large-dataset mode",
+    help="Lifts the row, column and size limits: models are screened on a sample and only the "
+         "winner is refit on the full data. Uploads are still capped by Streamlit's server.maxUploadSize.",
+)
+if large_mode:
+    st.sidebar.markdown("### Upload a dataset")
+else:
+    st.sidebar.markdown(f"### Upload a dataset (Max {MAX_FILE_SIZE_MB} MB)")
+uploaded_file = st.sidebar.file_uploader(
+    "Drag and drop file here", type=UPLOAD_TYPES,
+    help="CSV or other delimited text (optionally gzip, bz2 or zip compressed), or Parquet",
+)
 
 if uploaded_file:
-    if uploaded_file.size > MAX_FILE_SIZE_BYTES:
+    if not large_mode and uploaded_file.size > MAX_FILE_SIZE_BYTES:
         st.error(f"File too large. Max {MAX_FILE_SIZE_MB} MB.")
         st.stop()
 
     try:
-        df = pd.read_csv(uploaded_file)
+        clean_name, extension = os.path.splitext(uploaded_file.name)
+        if extension in (".gz", ".bz2", ".zip"):
+            clean_name = os.path.splitext(clean_name)[0]
+        upload_hash = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+        # Stored by content, so two sessions uploading different files under one name never overwrite each other
+        save_path = os.path.join("data", "uploads", upload_hash[:16], uploaded_file.name)
+
+        # Only write the upload to disk when it is a new file
+        if not os.path.exists(save_path):
+            with atomic_path(save_path) as tmp_path, open(tmp_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
+
+        if large_mode:
+            df = load_preview(save_path, upload_hash)
+        else:
+            df = load_dataset(save_path, upload_hash)
         n_rows, n_cols = df.shape
 
-        if n_cols > MAX_COLUMNS or n_rows > MAX_ROWS:
+        if not large_mode and (n_cols > MAX_COLUMNS or n_rows > MAX_ROWS):
             st.warning(f"Dataset too large: {n_cols} cols, {n_rows} rows. Max {MAX_COLUMNS} cols, {MAX_ROWS} rows.")
             st.stop()
 
-        clean_name = os.path.splitext(uploaded_file.name)[0]
-        save_path = os.path.join("data", f"{clean_name}.csv")
-        df.to_csv(save_path, index=False)
-
         st.success(f"Dataset '{clean_name}' uploaded and saved.")
 
         st.session_state['session_uploaded_files'][clean_name] = df
@@ -71,7 +110,9 @@ if st.session_state.get("uploaded_active") and st.session_state.get("active_uplo
     )
     st.session_state['user_goal'] = user_goal
 
-    temp_df = pd.read_csv(st.session_state['active_uploaded_dataset'])
+    active_path = st.session_state['active_uploaded_dataset']
+    loader = load_preview if large_mode else load_dataset
+    temp_df = loader(active_path, file_hash(active_path))
     target_column = st.sidebar.selectbox(
         "Select target column",
         options=temp_df.columns.tolist()
@@ -95,58 +136,100 @@ st.sidebar.markdown("""
 
 train_clicked = st.sidebar.button("Run AutoML Agent")
 
-if not train_clicked:
-    st.info("Upload a CSV dataset, fill in goal and target, then click **Run AutoML Agent**.")
-    st.stop()
+if train_clicked and st.session_state.get("active_uploaded_dataset"):
+    dataset_to_use = st.session_state['active_uploaded_dataset']
+    st.session_state['active_job_id'] = submit_job(
+        dataset_to_use,
+        os.path.basename(dataset_to_use).rsplit(".", 1)[0],
+        goal=st.session_state['user_goal'],
+        target_column=st.session_state['user_target_column'],
+        mode="large" if large_mode else "standard",
+    )
 
-# -------------------- Run pipeline --------------------
-dataset_to_use = st.session_state['active_uploaded_dataset']
-dataset_goal = st.session_state['user_goal']
-display_name = os.path.basename(dataset_to_use).rsplit(".", 1)[0]
+# -------------------- AutoML Jobs --------------------
+@st.fragment(run_every=2)
+def show_jobs():
+    """
+    Polls the job table; redraws only this panel until the active job ends.
+    """
+    jobs = list_jobs()
+    if jobs:
+        st.dataframe(
+            pd.DataFrame(jobs)[["id", "dataset_name", "status", "stage", "progress", "created_at", "finished_at"]],
+            hide_index=True,
+        )
 
-tmp_dir = tempfile.mkdtemp()
-df_tmp = pd.read_csv(dataset_to_use)
-cols = [c for c in df_tmp.columns if c != st.session_state['user_target_column']] + [st.session_state['user_target_column']]
-df_tmp = df_tmp[cols]
-work_file = os.path.join(tmp_dir, f"{display_name}_tmp.csv")
-df_tmp.to_csv(work_file, index=False)
+    job_id = st.session_state.get('active_job_id')
+    job = get_job(job_id) if job_id else None
+    if not job:
+        return
+    st.progress(job["progress"], text=f"Job {job_id}: {job['status']} ({job['stage'] or 'queued'})")
+    for event in get_events(job_id)[-5:]:
+        if event["message"]:
+            st.caption(f"{event['created_at']} [{event['stage']}] {event['message']}")
 
-st.subheader("AutoML Progress")
-progress = st.progress(0)
+    # Redraw the whole page once, when the job ends, to show its results
+    if job["status"] in ("finished", "failed") and st.session_state.get('rendered_job_id') != job_id:
+        st.rerun()
 
-with st.spinner("Running AutoML Agent..."):
-    try:
-        progress.progress(10)
-        X, y = preprocess_data(work_file)
-        progress.progress(40)
-        trained_models = train_models(X, y, display_name)
-        progress.progress(70)
-        results = evaluate_models(trained_models, display_name, dataset_goal)
-        progress.progress(90)
-        select_and_save_best_model(results)
-        progress.progress(100)
-        st.success("AutoML Agent completed successfully ")
-    finally:
-        shutil.rmtree(tmp_dir)
+
+# A job that has ended is rendered by this run, so the poller mustn't trigger another
+active_job = get_job(st.session_state['active_job_id']) if st.session_state.get('active_job_id') else None
+if active_job and active_job["status"] in ("finished", "failed"):
+    st.session_state['rendered_job_id'] = active_job["id"]
+
+st.subheader("AutoML Jobs")
+show_jobs()
+
+if not active_job or active_job["status"] not in ("finished", "failed"):
+    if not active_job:
+        st.info("Upload a CSV dataset, fill in goal and target, then click **Run AutoML Agent**.")
+    st.stop()
+
+if active_job["status"] == "failed":
+    st.error(f"AutoML run failed:\n\n{active_job['error']}")
+    st.stop()
+
+dataset_to_use = active_job["file_path"]
+display_name = active_job["dataset_name"]
+if active_job["mode"] == "large":
+    df = load_preview(dataset_to_use, file_hash(dataset_to_use))
+else:
+    df = load_dataset(dataset_to_use, file_hash(dataset_to_use))
+st.success("AutoML Agent completed successfully ")
 
 # -------------------- Display results --------------------
 st.subheader("Dataset Preview")
-df = pd.read_csv(dataset_to_use)
 st.write(f"**{display_name}**")
-st.write(f"Rows: {df.shape[0]}, Columns: {df.shape[1]}")
+if active_job["mode"] == "large":
+    st.write(f"First {df.shape[0]} rows, Columns: {df.shape[1]} (see the report for the full row count)")
+else:
+    st.write(f"Rows: {df.shape[0]}, Columns: {df.shape[1]}")
 st.dataframe(df.head(10))
 st.write(df.describe())
 st.write(df.isnull().sum())
 
 st.subheader("Training Report")
-report_path = os.path.join("reports", f"{display_name.replace(' ','_').lower()}_report.txt")
+# This job's own run folder, so another run of the same dataset can't swap its outputs
+outputs = output_paths(display_name, run=load_run(active_job["run_dir"]))
+report_path = outputs["report"]
 if os.path.exists(report_path):
     with open(report_path, "r") as f:
         st.text(f.read())
 
+# -------------------- Timing breakdown --------------------
+st.subheader("Timing Breakdown")
+trace_path = trace_path_for(active_job["id"])
+if os.path.exists(trace_path):
+    stages = pd.DataFrame(summarize(read_trace(trace_path)))
+    st.bar_chart(stages.set_index("stage")["wall_s"], horizontal=True)
+    st.dataframe(stages, hide_index=True)
+else:
+    st.info("No timing trace recorded for this run.")
+
 # -------------------- Display pre-training EDA --------------------
 st.subheader("Pre-training EDA Charts")
-pre_path = os.path.join("eda_charts", display_name.replace(" ", "_").lower(), "pre_training")
+pre_path = outputs["pre_training"]
 if os.path.exists(pre_path):
     for img in os.listdir(pre_path):
         if img.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
@@ -156,7 +239,7 @@ else:
 
 # -------------------- Display post-training EDA --------------------
 st.subheader("Post-training EDA Charts")
-post_path = os.path.join("eda_charts", display_name.replace(" ", "_").lower(), "post_training")
+post_path = outputs["post_training"]
 if os.path.exists(post_path):
     for img in os.listdir(post_path):
         if img.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
@@ -166,24 +249,23 @@ else:
 
 # -------------------- Display trained models --------------------
 st.subheader("Trained Models")
-model_files = [f for f in os.listdir("models") if f.startswith(display_name.replace(" ", "_").lower()) and f.endswith(('.pkl', '.joblib'))]
-if not model_files:
+# Listing reads the registry index only; no model file is unpickled
+registered_models = list_models(display_name)
+if not registered_models:
     st.info("No trained models found for this dataset.")
 else:
-    for model_file in model_files:
+    st.dataframe(
+        pd.DataFrame(registered_models)[["model_name", "metric", "score", "file_size", "created_at", "content_hash"]],
+        hide_index=True,
+    )
+    for entry in registered_models:
+        model_file = os.path.basename(entry["file_path"])
         st.markdown(f"### Model: {model_file}")
-        model_path = os.path.join("models", model_file)
-        try:
-            model = joblib.load(model_path)
-            st.write(model)
-        except Exception as e:
-            st.warning(f"Could not load model {model_file}: {e}")
-            continue
-
-        with open(model_path, "rb") as file:
-            st.download_button(
-                label=f"Download Model {model_file}",
-                data=file,
-                file_name=model_file,
-                mime="application/octet-stream"
-            )
+        st.write(entry["params"])
+        st.download_button(
+            label=f"Download Model {model_file}",
+            data=lambda path=entry["file_path"]: Path(path).read_bytes(),
+            file_name=model_file,
+            mime="application/octet-stream",
+            key=f"download_{entry['id']}"
+        )
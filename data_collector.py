@@ -1,11 +1,107 @@
 import os
-import requests
+import json
+import time
 import random
-from datetime import datetime
-from config import DATASET_SOURCES
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import DATASET_SOURCES, DOWNLOAD_WORKERS, DOWNLOAD_TIMEOUT, DOWNLOAD_RETRIES
+from tracing import span
+from workspace import atomic_path, write_json
+
+DATA_DIR = "data"
+CHUNK_SIZE = 1024 * 1024
+
+
+def make_session(pool_size=DOWNLOAD_WORKERS, retries=DOWNLOAD_RETRIES):
+    """
+    Creates a requests session with pooled keep-alive connections
+    and automatic retries with exponential backoff.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def fetch_url(url, file_path, session=None, timeout=DOWNLOAD_TIMEOUT, retries=DOWNLOAD_RETRIES):
+    """
+    Downloads url to file_path, streaming the body to disk in chunks.
+    A previously downloaded copy is revalidated with ETag / Last-Modified
+    and reused when the server answers 304 Not Modified.
+    Returns: True if the file was (re)downloaded, False if the cached copy was reused
+    """
+    session = session or make_session(pool_size=1, retries=retries)
+    meta_path = f"{file_path}.meta.json"
+    meta = _read_meta(meta_path)
+
+    # Only revalidate a cached copy that is complete and came from the same URL
+    headers = {}
+    cached = (
+        os.path.exists(file_path)
+        and meta.get("url") == url
+        and meta.get("size") == os.path.getsize(file_path)
+    )
+    if cached:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    # urllib3 retries connection errors and 5xx responses; this loop also
+    # retries a body that breaks off mid-stream.
+    for attempt in range(retries + 1):
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304 and cached:
+                    return False
+                response.raise_for_status()
+
+                # A body that breaks off leaves no partial file behind, even after the last retry
+                with atomic_path(file_path) as tmp_path:
+                    size = 0
+                    with open(tmp_path, "wb") as file:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            file.write(chunk)
+                            size += len(chunk)
+
+                    expected = response.headers.get("Content-Length")
+                    if expected is not None and "Content-Encoding" not in response.headers and int(expected) != size:
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f"Incomplete download: got {size} of {expected} bytes"
+                        )
 
+                # Written atomically too: a torn sidecar would send the wrong conditional GET
+                write_json(meta_path, {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "size": size,
+                })
+                return True
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
 
-def download_dataset(dataset_name=None):
+
+def download_dataset(dataset_name=None, session=None, data_dir=DATA_DIR):
     """
     Downloads a dataset.
     If dataset_name is None, picks a random dataset from DATASET_SOURCES.
@@ -22,26 +118,45 @@ def download_dataset(dataset_name=None):
 
     name = dataset["name"]
     url = dataset["url"]
-    goal = dataset.get("goal", "No goal specified")   
+    goal = dataset.get("goal", "No goal specified")
 
     print(f"\nSelected dataset: {name}")
     print(f"Downloading from: {url}")
 
     # Ensure data folder exists
-    os.makedirs("data", exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
 
     # Create safe filename
     safe_name = name.lower().replace(" ", "_")
-    file_path = f"data/{safe_name}.csv"
+    file_path = f"{data_dir}/{safe_name}.csv"
 
     # Request the file
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        with open(file_path, "wb") as file:
-            file.write(response.content)
-        print(f"Dataset saved successfully: {file_path}")
+        with span("download", dataset=name, url=url) as attrs:
+            attrs["downloaded"] = fetch_url(url, file_path, session=session)
+            attrs["bytes"] = os.path.getsize(file_path)
+        if attrs["downloaded"]:
+            print(f"Dataset saved successfully: {file_path}")
+        else:
+            print(f"Dataset unchanged, using cached copy: {file_path}")
         return file_path, name, goal
     except Exception as e:
         print(f"Dataset download failed: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
+
+
+def download_datasets(dataset_names=None, max_workers=DOWNLOAD_WORKERS, data_dir=DATA_DIR):
+    """
+    Downloads several datasets concurrently over one pooled session.
+    If dataset_names is None, downloads every dataset in DATASET_SOURCES.
+    Returns: list of (file_path, dataset_name, goal) in the order requested
+    """
+    if dataset_names is None:
+        dataset_names = [d["name"] for d in DATASET_SOURCES]
+
+    session = make_session(pool_size=max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda name: download_dataset(name, session=session, data_dir=data_dir),
+            dataset_names,
+        ))
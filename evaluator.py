@@ -1,40 +1,72 @@
-from sklearn.metrics import accuracy_score, r2_score, confusion_matrix, ConfusionMatrixDisplay
+from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 import os
 from datetime import datetime
 import matplotlib.pyplot as plt
 import numpy as np
+from tracing import span, shape_of
+from workspace import atomic_path
+from model_registry import model_params
 
-def evaluate_models(trained_models, dataset_name, dataset_goal):
+def evaluate_models(trained_models, dataset_name, dataset_goal, progress=None, output_base="eda_charts",
+                    reports_dir="reports"):
     """
     Evaluates a list of trained models and generates reports and post-training EDA charts.
     
-    trained_models: list of tuples (dataset_name, model_name, model, X_test, y_test)
+    trained_models: list of tuples (dataset_name, model_name, model, X_test, y_test, info)
+    Returns: list of tuples (dataset_name, model_name, model, score, X_test, y_test, info)
+    progress, if given, is called with a message as each model is scored.
+    Charts go under output_base and the report into reports_dir (a run's folders, see workspace.py).
     """
     print("\nEvaluating models...\n")
     results = []
 
-    for ds_name, name, model, X_test, y_test in trained_models:
-        if y_test.dtype != "object":
-            predictions = model.predict(X_test)
-            score = r2_score(y_test, predictions)
-            metric = "R² Score"
-        else:
-            predictions = model.predict(X_test)
-            score = accuracy_score(y_test, predictions)
-            metric = "Accuracy"
+    # One inference pass per model; predictions are shared by scoring and charts
+    for ds_name, name, model, X_test, y_test, info in trained_models:
+        with span(f"predict: {name}", input_shape=shape_of(X_test)):
+            info["predictions"], info["probabilities"] = predict_once(model, X_test)
 
+    # All candidates share one test split, so every metric is computed in one batch
+    y_test = trained_models[0][4]
+    is_classification = y_test.dtype == "object"
+    metric = "Accuracy" if is_classification else "R² Score"
+    scores = batch_scores(
+        np.vstack([info["predictions"] for *_, info in trained_models]), y_test.to_numpy(), is_classification
+    )
+
+    for (ds_name, name, model, X_test, y_test, info), score in zip(trained_models, scores):
+        score = float(score)
+        info["metric"] = metric
         print(f"{name} {metric}: {round(score, 4)}")
-        results.append((ds_name, name, model, score, X_test, y_test))
+        if progress:
+            progress(f"{name} {metric}: {round(score, 4)}")
+        results.append((ds_name, name, model, score, X_test, y_test, info))
 
         # Generate post-training EDA charts for this model
-        generate_post_training_eda(model, X_test, y_test, dataset_name=ds_name)
+        with span("post_training_eda", model=name):
+            generate_post_training_eda(model, X_test, y_test, dataset_name=ds_name, output_base=output_base,
+                                       predictions=info["predictions"])
+
+    # Every survivor carries the same race, which includes the candidates it dropped
+    race = next((info["race"] for *_, info in results if info.get("race")), None)
+    if race:
+        with span("learning_curves"):
+            generate_learning_curve_chart(race, results, dataset_name, output_base)
+
+    report_path = write_report(results, dataset_name, dataset_goal, reports_dir)
+    print(f"\nReport saved to: {report_path}")
+    return results
+
 
-    # Save detailed report
-    os.makedirs("reports", exist_ok=True)
+def write_report(results, dataset_name, dataset_goal, reports_dir="reports"):
+    """
+    Writes the evaluation report for a set of results from evaluate_models.
+    The report is written to a temporary file and renamed into place.
+    Returns: report path
+    """
     clean_name = dataset_name.replace(" ", "_").lower()
-    report_path = f"reports/{clean_name}_report.txt"
+    report_path = os.path.join(reports_dir, f"{clean_name}_report.txt")
 
-    with open(report_path, "w") as f:
+    with atomic_path(report_path) as tmp_path, open(tmp_path, "w") as f:
         f.write("========== Model Evaluation Report ==========\n")
         f.write(f"Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"Dataset: {dataset_name}\n")
@@ -42,34 +74,161 @@ def evaluate_models(trained_models, dataset_name, dataset_goal):
         f.write("=============================================\n\n")
 
         f.write("----- Dataset Information -----\n")
-        X_test_sample = trained_models[0][3]
-        y_test_sample = trained_models[0][4]
+        X_test_sample = results[0][4]
+        y_test_sample = results[0][5]
         f.write(f"Number of rows: {X_test_sample.shape[0]}\n")
         f.write(f"Number of features: {X_test_sample.shape[1]}\n")
         f.write(f"Target column: {y_test_sample.name if hasattr(y_test_sample, 'name') else 'target'}\n")
         f.write(f"Problem type: {'Regression' if y_test_sample.dtype != 'object' else 'Classification'}\n\n")
 
         f.write("----- Models and Performance -----\n")
-        for ds_name, name, model, score, _, _ in results:
+        for ds_name, name, model, score, _, _, info in results:
             f.write(f"Model: {name}\n")
             f.write(f"Performance Score: {round(score, 4)}\n")
+            f.write(f"Fit Time: {info['fit_time']:.2f}s\n")
+            if "binning_time" in info:
+                f.write(f"Feature Binning: {info['binning_time']:.2f}s (once, shared by every boosting fit)\n")
+            if "n_iter" in info:
+                f.write(f"Boosting Iterations: {info['n_iter']} (early stopping)\n")
             f.write("Parameters:\n")
-            params = model.get_params()
+            params = model_params(model)
             for param_key, param_value in params.items():
                 f.write(f"  - {param_key}: {param_value}\n")
+            if info.get("search_history"):
+                write_search_summary(f, info)
             f.write("\n")
 
+        race = next((info["race"] for *_, info in results if info.get("race")), None)
+        if race:
+            write_race_summary(f, race, results)
+
         f.write("=============================================\n")
 
-    print(f"\nReport saved to: {report_path}")
-    return results
+    return report_path
+
+
+def predict_once(model, X_test):
+    """
+    Runs a single inference pass over X_test.
+    For classifiers with predict_proba the labels are taken from the argmax of
+    the probabilities, which is what predict computes, so both come from one pass.
+    Returns: predictions, probabilities (None if the model has no predict_proba)
+    """
+    if hasattr(model, "predict_proba") and hasattr(model, "classes_"):
+        probabilities = model.predict_proba(X_test)
+        return model.classes_[np.argmax(probabilities, axis=1)], probabilities
+    return model.predict(X_test), None
+
+
+def batch_scores(predictions, y_true, is_classification):
+    """
+    Scores every candidate at once.
+    predictions: array of shape (n_models, n_samples)
+    Returns: accuracy (classification) or R² (regression) per model
+    """
+    if is_classification:
+        return (predictions == y_true[np.newaxis, :]).mean(axis=1)
+
+    y_true = y_true.astype(np.float64)
+    residual = ((predictions.astype(np.float64) - y_true) ** 2).sum(axis=1)
+    total = ((y_true - y_true.mean()) ** 2).sum()
+    if total == 0:
+        # Constant target: same convention as r2_score
+        return np.where(residual == 0, 1.0, 0.0)
+    return 1 - residual / total
+
+
+def write_search_summary(f, info):
+    """
+    Writes one line per successive-halving rung: trials, rows used and best validation score.
+    """
+    history = info["search_history"]
+    f.write(f"Hyperparameter Search ({len(history)} trials in {info['search_time']:.2f}s):\n")
+    for rung in sorted({trial["rung"] for trial in history}):
+        trials = [trial for trial in history if trial["rung"] == rung]
+        best = max(trials, key=lambda trial: trial["score"])
+        f.write(f"  - Rung {rung}: {len(trials)} configs on {trials[0]['n_samples']} rows, "
+                f"best score {round(best['score'], 4)}\n")
+    selected = ", ".join(f"{key}={value}" for key, value in info["best_params"].items())
+    f.write(f"  - Selected: {selected}\n")
+
+
+def _learning_curves(race, results):
+    """
+    Joins each candidate's racing rounds with its final score on the test split, if it survived.
+    Returns: dict of model name -> list of (rows, score, label) points
+    """
+    final = {name: (info["race"]["full_rows"], score, f"{info['fit_time']:.2f}s full fit, test split")
+             for _, name, _, score, _, _, info in results if info.get("race")}
+    curves = {}
+    for name, points in race["curves"].items():
+        curves[name] = [(point["n_samples"], point["score"], f"{point['fit_time']:.2f}s fit")
+                        for point in points if point["score"] is not None]
+        if name in final:
+            curves[name].append(final[name])
+    return curves
+
+
+def write_race_summary(f, race, results):
+    """
+    Writes each candidate's learning curve and, for dropped ones, when and against whom they lost.
+    """
+    f.write("----- Learning-Curve Racing -----\n")
+    f.write(f"Rounds scored on a held-out fold of {race['validation_rows']} rows; candidates behind the "
+            f"leader in a paired t-test (p < {race['alpha']}) were dropped. Racing took {race['race_time']:.2f}s.\n")
+    for name, points in _learning_curves(race, results).items():
+        f.write(f"Model: {name}\n")
+        for n_samples, score, label in points:
+            f.write(f"  - {n_samples} rows: {round(score, 4)} ({label})\n")
+        elimination = race["eliminated"].get(name)
+        if elimination:
+            f.write(f"  - Dropped after {elimination['n_samples']} rows: behind {elimination['leader']} "
+                    f"(p={elimination['p_value']:.3g})\n")
+    f.write("\n")
 
 
-def generate_post_training_eda(model, X_test, y_test, dataset_name, output_base="eda_charts"):
+def generate_learning_curve_chart(race, results, dataset_name, output_base="eda_charts"):
+    """
+    Plots every candidate's score against training rows, racing rounds plus
+    the survivors' final score; dropped candidates end in a cross.
+    Saved as <output_base>/<dataset_name>/post_training/learning_curves.png
+    """
+    safe_name = dataset_name.replace(" ", "_").lower()
+    output_folder = os.path.join(output_base, safe_name, "post_training")
+    os.makedirs(output_folder, exist_ok=True)
+
+    plt.figure(figsize=(8, 6))
+    for name, points in _learning_curves(race, results).items():
+        if not points:
+            continue
+        rows, scores, _ = zip(*points)
+        line, = plt.plot(rows, scores, marker="o", label=name)
+        if name in race["eliminated"]:
+            plt.plot(rows[-1], scores[-1], marker="x", markersize=12, color=line.get_color())
+    plt.xscale("log")
+    plt.xlabel("Training rows")
+    plt.ylabel(results[0][6]["metric"])
+    plt.title(f"Learning Curves - {dataset_name}")
+    plt.legend()
+    plt.tight_layout()
+    _save_figure(os.path.join(output_folder, "learning_curves.png"))
+    plt.close()
+
+
+def _save_figure(path):
+    with atomic_path(path) as tmp_path:
+        plt.savefig(tmp_path)
+
+
+def generate_post_training_eda(model, X_test, y_test, dataset_name, output_base="eda_charts", predictions=None):
     """
     Generates post-training EDA charts for a specific dataset.
-    Charts are saved in eda_charts/<dataset_name>/post_training/
+    Charts are saved in <output_base>/<dataset_name>/post_training/
+    Pass predictions to reuse an earlier inference pass instead of predicting again.
     """
+    if predictions is None:
+        predictions = model.predict(X_test)
+
     # Clean dataset name for folder
     safe_name = dataset_name.replace(" ", "_").lower()
     output_folder = os.path.join(output_base, safe_name, "post_training")
@@ -86,23 +245,21 @@ def generate_post_training_eda(model, X_test, y_test, dataset_name, output_base=
         plt.bar(range(len(importances)), importances[indices], align="center")
         plt.xticks(range(len(importances)), [feature_names[i] for i in indices], rotation=90)
         plt.tight_layout()
-        plt.savefig(os.path.join(output_folder, "feature_importances.png"))
+        _save_figure(os.path.join(output_folder, "feature_importances.png"))
         plt.close()
 
     # Classification: Confusion Matrix
     if y_test.dtype == "object":
-        predictions = model.predict(X_test)
         cm = confusion_matrix(y_test, predictions)
         disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=np.unique(y_test))
         disp.plot(cmap=plt.cm.Blues)
         plt.title(f"Confusion Matrix - {dataset_name}")
         plt.tight_layout()
-        plt.savefig(os.path.join(output_folder, "confusion_matrix.png"))
+        _save_figure(os.path.join(output_folder, "confusion_matrix.png"))
         plt.close()
 
     # Regression: Predicted vs Actual Scatter Plot
     else:
-        predictions = model.predict(X_test)
         plt.figure(figsize=(8, 6))
         plt.scatter(y_test, predictions, alpha=0.6)
         plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--')
@@ -110,5 +267,5 @@ def generate_post_training_eda(model, X_test, y_test, dataset_name, output_base=
         plt.ylabel("Predicted")
         plt.title(f"Predicted vs Actual - {dataset_name}")
         plt.tight_layout()
-        plt.savefig(os.path.join(output_folder, "predicted_vs_actual.png"))
+        _save_figure(os.path.join(output_folder, "predicted_vs_actual.png"))
         plt.close()
\ No newline at end of file
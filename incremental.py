@@ -0,0 +1,360 @@
+import io
+import os
+import math
+import hashlib
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from config import (INCREMENTAL_DRIFT_THRESHOLD, INCREMENTAL_NEW_CATEGORY_RATE, INCREMENTAL_REPLAY_ROWS,
+                    INCREMENTAL_MAX_TREE_GROWTH)
+from ingestion import read_dataset, sniff, HASH_CHUNK_SIZE
+from preprocessor import preprocess_data, category_values
+from trainer import train_models, split_train_test
+from evaluator import evaluate_models
+from model_selector import select_and_save_best_model
+from model_registry import list_models, load_artifact, save_artifact, register_model, model_params
+from tracing import span, shape_of
+from workspace import run_workspace, output_paths, append_text
+
+
+def _prefix_hash(file_path, size):
+    """
+    SHA-256 of the first size bytes of a file.
+    """
+    digest = hashlib.sha256()
+    remaining = size
+    with open(file_path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _ends_with_newline(file_path, size):
+    if size == 0:
+        return False
+    with open(file_path, "rb") as f:
+        f.seek(size - 1)
+        return f.read(1) == b"\n"
+
+
+def _vstack(a, b):
+    return sparse.vstack([a, b], format="csr") if sparse.issparse(a) else np.vstack([a, b])
+
+
+def _reorder_target(df, target_column):
+    if target_column:
+        df = df[[c for c in df.columns if c != target_column] + [target_column]]
+    return df
+
+
+def read_appended_rows(file_path, state):
+    """
+    Finds rows appended to file_path since it was last ingested.
+    The file counts as appended to only if its first state["size"] bytes are
+    unchanged (same prefix hash) and ended on a line break.
+    Returns: DataFrame of the new rows (possibly empty), or None if the file was rewritten
+    """
+    # Only plain-text files can be appended to; a compressed or Parquet file is always re-ingested
+    if state.get("compression") or state.get("format", "csv") != "csv":
+        return None
+    size = os.path.getsize(file_path)
+    if size < state["size"] or not _ends_with_newline(file_path, state["size"]):
+        return None
+    if _prefix_hash(file_path, state["size"]) != state["prefix_hash"]:
+        return None
+
+    with open(file_path, "rb") as f:
+        f.seek(state["size"])
+        tail = f.read()
+    if not tail.strip():
+        return pd.DataFrame(columns=state["columns"])
+    return pd.read_csv(io.BytesIO(tail), sep=state["sep"], header=None, names=state["columns"],
+                       encoding=state.get("encoding", "utf-8"), skipinitialspace=state.get("skipinitialspace", False))
+
+
+def _initial_state(file_path, df, X, y, model):
+    """
+    Everything later updates need: where the ingested bytes end, the file's
+    raw column order, and per model family either the least-squares normal
+    equations (LinearRegression) or a replay sample of past rows (other linear models).
+    Both are built from the training split only, as the model was, so an
+    update never learns the test rows its score was reported on.
+    """
+    X, _, y, _ = split_train_test(X, y)
+    size = os.path.getsize(file_path)
+    dialect = sniff(file_path)
+    state = {
+        "file_path": file_path,
+        "size": size,
+        "prefix_hash": _prefix_hash(file_path, size),
+        "format": dialect["format"],
+        "compression": dialect["compression"],
+        "sep": dialect.get("sep"),
+        "encoding": dialect.get("encoding"),
+        "skipinitialspace": dialect.get("skipinitialspace"),
+        "columns": df.columns.tolist(),
+        "n_rows": X.shape[0],
+        "base_estimators": model.get_params().get("n_estimators"),
+        "updates": [],
+    }
+    if hasattr(model, "coef_") and not hasattr(model, "predict_proba"):
+        X_aug = _with_intercept(X)
+        state["xtx"] = np.asarray((X_aug.T @ X_aug).todense() if sparse.issparse(X_aug) else X_aug.T @ X_aug)
+        state["xty"] = np.asarray(X_aug.T @ y.to_numpy(dtype=np.float64)).ravel()
+    elif hasattr(model, "coef_"):
+        rng = np.random.RandomState(42)
+        idx = np.sort(rng.choice(X.shape[0], min(INCREMENTAL_REPLAY_ROWS, X.shape[0]), replace=False))
+        state["replay_X"], state["replay_y"] = X[idx], y.iloc[idx].reset_index(drop=True)
+    return state
+
+
+def _with_intercept(X):
+    ones = np.ones((X.shape[0], 1))
+    return sparse.hstack([X, ones], format="csr") if sparse.issparse(X) else np.hstack([X, ones])
+
+
+def full_retrain(file_path, dataset_name, dataset_goal="", target_column=None):
+    """
+    Runs the whole pipeline on the current file, in a new run folder, and saves
+    the best model with the state later calls to update_dataset build on.
+    Returns: path of the saved artifact
+    """
+    with run_workspace(dataset_name) as run:
+        raw = read_dataset(file_path)
+        X, y, pipeline = preprocess_data(_reorder_target(raw, target_column), return_pipeline=True,
+                                         dataset_name=dataset_name, output_base=run["output_base"])
+        trained_models = train_models(X, y, dataset_name)
+        results = evaluate_models(trained_models, dataset_name, dataset_goal, output_base=run["output_base"],
+                                  reports_dir=run["reports_dir"])
+        model_path = select_and_save_best_model(results, pipeline, models_dir=run["models_dir"])
+
+        artifact = load_artifact(model_path)
+        artifact["incremental"] = _initial_state(file_path, raw, X, y, artifact["model"])
+        _save(model_path, artifact)
+    return model_path
+
+
+def _save(model_path, artifact):
+    compressed = save_artifact(artifact, model_path)
+    register_model(model_path, artifact["dataset_name"], artifact["model_name"], score=artifact["score"],
+                   metric=artifact["metric"], params=model_params(artifact["model"]), compressed=compressed)
+
+
+def _unseen_category_rate(pipeline, df):
+    """
+    Fraction of rows holding a category the fitted pipeline has never seen
+    (those encode as all zeros). Hashed columns have no vocabulary and never count;
+    screened columns are bucketed first, so their rare categories don't either.
+    """
+    df = pipeline.bucket(df)
+    vocab = getattr(pipeline, "vocab", None)
+    if vocab is None:
+        vocab = {col: arg for col, (kind, arg) in pipeline.encodings.items() if kind != "hash"}
+    unseen = np.zeros(len(df), dtype=bool)
+    for col, categories in vocab.items():
+        unseen |= ~category_values(df[col]).isin(categories).to_numpy()
+    return unseen.mean() if len(df) else 0.0
+
+
+def _drift(pipeline, running, X_new):
+    """
+    Adds the new rows to running statistics of every row appended since the
+    model was fitted.
+    Returns: largest shift of any feature's mean between the appended rows and
+    the training data, in training standard deviations, less two standard
+    errors so a handful of rows can't trigger a retrain by chance alone
+    """
+    scaler = pipeline.scaler
+    # Undo the frozen scaling to compare raw encoded features
+    if sparse.issparse(X_new):
+        X_raw = sparse.csr_matrix(X_new.multiply(scaler.scale_))
+    else:
+        X_raw = X_new * scaler.scale_ + (scaler.mean_ if scaler.with_mean else 0.0)
+    running.partial_fit(X_raw)
+    if not len(scaler.mean_):
+        return 0.0
+    shift = np.abs(running.mean_ - scaler.mean_) / scaler.scale_
+    return float(max(0.0, np.max(shift) - 2 / math.sqrt(np.max(running.n_samples_seen_))))
+
+
+def _update_model(model, state, X_new, y_new):
+    """
+    Updates a fitted model with new rows in place.
+    Returns: description of the update, or None if this model can't be updated incrementally
+    """
+    params = model.get_params()
+
+    if "warm_start" in params and "n_estimators" in params:
+        if hasattr(model, "classes_") and not np.array_equal(np.unique(y_new), model.classes_):
+            return None  # new trees must see every class the forest knows
+        base = state["base_estimators"] or params["n_estimators"]
+        n_add = max(1, math.ceil(base * len(y_new) / state["n_rows"]))
+        if params["n_estimators"] + n_add > base * INCREMENTAL_MAX_TREE_GROWTH:
+            return None  # too many trees fitted on slices; start over
+        model.set_params(warm_start=True, n_estimators=params["n_estimators"] + n_add)
+        model.fit(X_new, y_new)
+        model.set_params(warm_start=False)
+        return f"added {n_add} trees fitted on the new rows"
+
+    if "xtx" in state:
+        X_aug = _with_intercept(X_new)
+        xtx = X_aug.T @ X_aug
+        state["xtx"] += np.asarray(xtx.todense() if sparse.issparse(xtx) else xtx)
+        state["xty"] += np.asarray(X_aug.T @ y_new.to_numpy(dtype=np.float64)).ravel()
+        solution = np.linalg.lstsq(state["xtx"], state["xty"], rcond=None)[0]
+        model.coef_, model.intercept_ = solution[:-1], solution[-1]
+        return "re-solved least squares over every training row seen"
+
+    if "replay_X" in state and "warm_start" in params:
+        X_fit = _vstack(state["replay_X"], X_new)
+        y_fit = pd.concat([state["replay_y"], y_new], ignore_index=True)
+        if hasattr(model, "classes_") and not np.array_equal(np.unique(y_fit), model.classes_):
+            return None
+        model.set_params(warm_start=True)
+        model.fit(X_fit, y_fit)
+        model.set_params(warm_start=False)
+        _update_replay(state, X_new, y_new)
+        return f"warm-started on the new rows plus {len(state['replay_y'])} replayed rows"
+
+    return None
+
+
+def _update_replay(state, X_new, y_new):
+    """
+    Reservoir sampling over every row seen, so the replay rows stay a uniform
+    sample of the whole history. Expects state["n_rows"] to not yet count the new rows.
+    """
+    rng = np.random.RandomState(state["n_rows"])
+    k = INCREMENTAL_REPLAY_ROWS
+    n_replay = len(state["replay_y"])
+    X_all = _vstack(state["replay_X"], X_new)
+    y_all = pd.concat([state["replay_y"], y_new], ignore_index=True)
+
+    # A replay sample smaller than k (small datasets) takes new rows until full
+    fill = min(k - n_replay, len(y_new))
+    idx = np.concatenate([np.arange(n_replay), n_replay + np.arange(fill)])
+    rows = np.arange(fill, len(y_new))
+    slots = rng.randint(state["n_rows"] + rows + 1)
+    accepted = slots < k
+    # Later rows overwrite earlier ones in the same slot, as in sequential reservoir sampling
+    for slot, row in zip(slots[accepted], rows[accepted]):
+        idx[slot] = n_replay + row
+
+    state["replay_X"] = X_all[idx]
+    state["replay_y"] = y_all.iloc[idx].reset_index(drop=True)
+
+
+def update_dataset(file_path, dataset_name, dataset_goal="", target_column=None):
+    """
+    Brings the saved model for dataset_name up to date with file_path.
+    If rows were only appended since the model was trained, it is updated in
+    place from the new rows alone: forests grow extra trees (warm_start),
+    LinearRegression re-solves its normal equations and other linear models
+    are warm-started on the new rows plus a replay sample. The fitted
+    preprocessing stays frozen, so the model's inputs keep their meaning,
+    while running feature statistics track how far the data has moved.
+    Falls back to full_retrain when the file was rewritten, the model has no
+    incremental state or is histogram gradient boosting (an unsupported model:
+    warm-starting it would re-bin the new rows), the features drifted more than
+    INCREMENTAL_DRIFT_THRESHOLD standard deviations, or more than
+    INCREMENTAL_NEW_CATEGORY_RATE of new rows hold unseen categories. The new
+    report says "full retrain (<reason>)".
+    Returns: path of the saved artifact, and "unchanged", "incremental" or "full"
+    """
+    entries = list_models(dataset_name)
+    artifact = load_artifact(entries[0]["file_path"]) if entries else None
+    state = artifact.get("incremental") if artifact else None
+
+    def retrain(reason):
+        print(f"Full retrain of '{dataset_name}': {reason}")
+        model_path = full_retrain(file_path, dataset_name, dataset_goal, target_column)
+        append_text(output_paths(dataset_name)["report"],
+                    f"\n----- Incremental update -----\nUpdate: full retrain ({reason})\n")
+        return model_path, "full"
+
+    if state is None or artifact.get("pipeline") is None:
+        return retrain("no incremental state saved with the current model")
+    if isinstance(artifact["model"], Pipeline):
+        # Gradient boosting sits behind its FeatureBinner; warm-starting it would make
+        # it re-bin the new rows with other thresholds than its trees were grown on
+        return retrain(f"unsupported model: {artifact['model_name']} can't be updated in place")
+
+    with span("read_appended", file=file_path) as attrs:
+        new_rows = read_appended_rows(file_path, state)
+        attrs["output_shape"] = shape_of(new_rows)
+    if new_rows is None:
+        return retrain("the file changed other than by appending rows")
+    new_rows = new_rows.dropna()
+    if new_rows.empty:
+        print(f"No new rows for '{dataset_name}'")
+        return entries[0]["file_path"], "unchanged"
+
+    pipeline = artifact["pipeline"]
+    new_rows = _reorder_target(new_rows, pipeline.target_column)
+    unseen_rate = _unseen_category_rate(pipeline, new_rows)
+    if unseen_rate > INCREMENTAL_NEW_CATEGORY_RATE:
+        return retrain(f"{unseen_rate:.1%} of new rows have unseen categories")
+
+    X_new = pipeline.transform(new_rows)
+    y_new = new_rows.iloc[:, -1]
+
+    running = state.setdefault("running_scaler", StandardScaler(with_mean=not sparse.issparse(X_new)))
+    drift = _drift(pipeline, running, X_new)
+    if drift > INCREMENTAL_DRIFT_THRESHOLD:
+        return retrain(f"feature drift of {drift:.2f} standard deviations")
+
+    model = artifact["model"]
+    # Score on the new rows before they are learned: an honest check of the model being replaced
+    score_before = float(model.score(X_new, y_new))
+    with span("incremental_update", model=artifact["model_name"], input_shape=shape_of(X_new)):
+        description = _update_model(model, state, X_new, y_new)
+    if description is None:
+        return retrain(f"{artifact['model_name']} can't absorb these rows incrementally")
+
+    state["n_rows"] += len(y_new)
+    state["size"] = os.path.getsize(file_path)
+    state["prefix_hash"] = _prefix_hash(file_path, state["size"])
+    update = {
+        "updated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "new_rows": len(y_new),
+        "score_on_new_rows": score_before,
+        "drift": drift,
+        "unseen_category_rate": float(unseen_rate),
+        "update": description,
+    }
+    state["updates"].append(update)
+    _save(entries[0]["file_path"], artifact)
+
+    # The update is logged in the dataset's latest published report
+    append_text(output_paths(dataset_name)["report"], "".join([
+        "\n----- Incremental update -----\n",
+        f"Updated on: {update['updated_at']}\n",
+        f"New rows: {len(y_new)} (total {state['n_rows']})\n",
+        f"{artifact['metric'] or 'Score'} on new rows before update: {round(score_before, 4)}\n",
+        f"Largest feature drift: {drift:.3f} std\n",
+        f"Update: {artifact['model_name']} {description}\n",
+    ]))
+
+    print(f"Updated {artifact['model_name']} for '{dataset_name}' with {len(y_new)} new rows: {description}")
+    return entries[0]["file_path"], "incremental"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update a dataset's saved model with newly appended rows.")
+    parser.add_argument("file", help="Current version of the dataset CSV")
+    parser.add_argument("--dataset", required=True, help="Dataset name the model was saved under")
+    parser.add_argument("--goal", default="", help="Dataset goal for the report if a full retrain runs")
+    parser.add_argument("--target", help="Target column (default: the last column)")
+    args = parser.parse_args()
+    path, mode = update_dataset(args.file, args.dataset, args.goal, args.target)
+    print(f"{mode}: {path}")
@@ -0,0 +1,466 @@
+import io
+import os
+import bz2
+import csv
+import gzip
+import json
+import zlib
+import struct
+import hashlib
+import pandas as pd
+
+from tracing import span, shape_of
+from workspace import atomic_path, write_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; pandas parses CSV and pickle backs the cache
+    pa = pa_csv = feather = pq = None
+
+CACHE_DIR = os.path.join("data", ".cache")
+# Part of every parsed-frame cache name; bump when parsing changes (sniffing,
+# header detection, dtypes) so frames parsed the old way stop being served
+PARSER_VERSION = 2
+HASH_CHUNK_SIZE = 1024 * 1024
+# Delimiter, header and encoding are decided from this much of the (decompressed) file
+SNIFF_BYTES = 64 * 1024
+SNIFF_DELIMITERS = ",;\t|"
+
+# path -> (size, mtime) and content hash, kept on disk so a file that hasn't
+# changed since any earlier run is never hashed again
+HASH_INDEX_PATH = os.path.join(CACHE_DIR, "hash_index.json")
+
+# (path, size, mtime) -> content hash, so unchanged files are hashed once per process
+_hash_memo = {}
+# (path, size, mtime) -> sniffed dialect
+_dialect_memo = {}
+
+_MAGIC = {b"\x1f\x8b": "gzip", b"BZh": "bz2", b"PK\x03\x04": "zip"}
+
+
+def _stat_key(file_path):
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def _read_hash_index():
+    try:
+        with open(HASH_INDEX_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _known_hash(file_path):
+    """
+    Content hash of a file if this process or an earlier run already hashed
+    these exact bytes (same path, size and mtime), otherwise None. Never reads the file.
+    """
+    memo_key = _stat_key(file_path)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+    entry = _read_hash_index().get(memo_key[0])
+    if entry and (entry["size"], entry["mtime_ns"]) == memo_key[1:]:
+        _hash_memo[memo_key] = entry["hash"]
+        return entry["hash"]
+    return None
+
+
+def _remember_hash(file_path, digest, memo_key=None):
+    memo_key = memo_key or _stat_key(file_path)
+    _hash_memo[memo_key] = digest
+    # Read-modify-write without a lock: a concurrent writer can only drop
+    # another entry, which then gets hashed again next time
+    try:
+        index = _read_hash_index()
+        index[memo_key[0]] = {"size": memo_key[1], "mtime_ns": memo_key[2], "hash": digest}
+        write_json(HASH_INDEX_PATH, index)
+    except OSError as e:
+        print(f"Could not update {HASH_INDEX_PATH}: {e}")
+
+
+def file_hash(file_path):
+    """
+    Returns the SHA-256 hex digest of a file's content, read in chunks.
+    """
+    digest = _known_hash(file_path)
+    if digest is not None:
+        return digest
+
+    memo_key = _stat_key(file_path)
+    with open(file_path, "rb") as f:
+        reader = _HashingReader(f)
+        reader.drain()
+    _remember_hash(file_path, reader.hexdigest(), memo_key)
+    return _hash_memo[memo_key]
+
+
+class _HashingReader(io.RawIOBase):
+    """
+    Read-only view of an open binary file that hashes every byte it hands
+    out, so parsing a file also computes its content hash.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._digest = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._f.readinto(buffer)
+        if n:
+            self._digest.update(memoryview(buffer)[:n])
+        return n
+
+    def drain(self):
+        # Parsers may stop before the end (e.g. a zip's central directory); the hash covers every byte
+        for chunk in iter(lambda: self._f.read(HASH_CHUNK_SIZE), b""):
+            self._digest.update(chunk)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class _ZipMemberReader(io.RawIOBase):
+    """
+    Streams the first file of a zip archive straight from its local header.
+    zipfile needs a seekable file to find the central directory at the end;
+    reading front to back instead keeps ingestion a single pass.
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+        while True:
+            header = self._read_exact(30)
+            if header[:4] != b"PK\x03\x04":
+                raise ValueError("Zip archive contains no file")
+            flags, method = struct.unpack("<HH", header[6:10])
+            compressed_size = struct.unpack("<I", header[18:22])[0]
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            name = self._read_exact(name_length)
+            self._read_exact(extra_length)
+            if not name.endswith(b"/"):
+                break
+            self._read_exact(compressed_size)  # directory entries hold no data
+
+        if flags & 0x1:
+            raise ValueError("Encrypted zip archives are not supported")
+        if method == 8:
+            self._inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif method == 0 and not flags & 0x8 and compressed_size != 0xFFFFFFFF:
+            self._inflate = None
+            self._remaining = compressed_size
+        else:
+            raise ValueError(f"Unsupported zip compression (method {method})")
+        self._pending = memoryview(b"")
+
+    def _read_exact(self, n):
+        data = self._raw.read(n)
+        if len(data) != n:
+            raise ValueError("Truncated zip archive")
+        return data
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            if self._inflate is None:
+                if not self._remaining:
+                    return 0
+                self._pending = memoryview(self._raw.read(min(HASH_CHUNK_SIZE, self._remaining)))
+                if not self._pending:
+                    raise ValueError("Truncated zip archive")
+                self._remaining -= len(self._pending)
+            else:
+                if self._inflate.eof:
+                    return 0
+                data = self._raw.read(HASH_CHUNK_SIZE)
+                if not data:
+                    raise ValueError("Truncated zip archive")
+                self._pending = memoryview(self._inflate.decompress(data))
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def _detect_format(file_path):
+    """
+    Returns: (format, compression) from the file's magic bytes, falling back to its extension
+    """
+    with open(file_path, "rb") as f:
+        magic = f.read(4)
+    if magic == b"PAR1" or file_path.lower().endswith((".parquet", ".pq")):
+        return "parquet", None
+    for prefix, compression in _MAGIC.items():
+        if magic.startswith(prefix):
+            return "csv", compression
+    return "csv", None
+
+
+def _decompressed(raw, compression):
+    """
+    Wraps a binary stream so reads return the decompressed bytes.
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(raw, mode="rb")
+    if compression == "zip":
+        return io.BufferedReader(_ZipMemberReader(raw), buffer_size=HASH_CHUNK_SIZE)
+    return io.BufferedReader(raw, buffer_size=HASH_CHUNK_SIZE) if isinstance(raw, io.RawIOBase) else raw
+
+
+def _detect_encoding(sample):
+    if sample.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    if sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16"
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        # Every byte is valid latin-1, so the parse never fails on a stray character
+        return "latin-1"
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _has_header(rows):
+    """
+    Guesses whether the first row holds column names: a header never
+    contains a number, names a numeric column with text, and its cells
+    don't reappear as values in the column below.
+    """
+    first, rest = rows[0], rows[1:]
+    if any(_is_number(cell) for cell in first):
+        return False
+    columns = list(zip(*[row for row in rest if len(row) == len(first)]))
+    if not columns:
+        return True
+    for column in columns:
+        values = [value for value in column if value]
+        if values and all(_is_number(value) for value in values):
+            return True
+    return not any(cell in column for cell, column in zip(first, columns))
+
+
+def sniff(file_path):
+    """
+    Works out how to parse a dataset file from its first SNIFF_BYTES:
+    format (CSV or Parquet), compression (gzip, bz2, zip), text encoding,
+    delimiter, whether the first row is a header, and the column names
+    (column_0, column_1, ... without a header). Columns that already hold text
+    in the sample are listed so the full parse can skip type inference for them.
+    Returns: dict describing the file
+    """
+    memo_key = _stat_key(file_path)
+    if memo_key in _dialect_memo:
+        return _dialect_memo[memo_key]
+
+    file_format, compression = _detect_format(file_path)
+    dialect = {"format": file_format, "compression": compression}
+    if file_format == "parquet":
+        if pq is None:
+            raise ImportError("Reading Parquet files requires pyarrow")
+        dialect["names"] = pq.read_schema(file_path).names
+        _dialect_memo[memo_key] = dialect
+        return dialect
+
+    with open(file_path, "rb") as f:
+        sample = _decompressed(f, compression).read(SNIFF_BYTES)
+    if len(sample) == SNIFF_BYTES and b"\n" in sample:
+        sample = sample[:sample.rindex(b"\n") + 1]  # drop the cut-off last line
+    encoding = _detect_encoding(sample)
+    text = sample.decode(encoding, errors="replace")
+
+    try:
+        sniffed = csv.Sniffer().sniff(text[:8192], delimiters=SNIFF_DELIMITERS)
+        sep, skipinitialspace = sniffed.delimiter, sniffed.skipinitialspace
+    except csv.Error:
+        # One column, or too few lines to tell: count the candidates in the first line
+        first_line = text.split("\n", 1)[0]
+        sep, skipinitialspace = max(SNIFF_DELIMITERS, key=first_line.count), False
+        sep = sep if first_line.count(sep) else ","
+
+    rows = [row for row in csv.reader(io.StringIO(text), delimiter=sep, skipinitialspace=skipinitialspace) if row]
+    header = _has_header(rows) if rows else True
+    dialect.update({
+        "encoding": encoding,
+        "sep": sep,
+        "skipinitialspace": skipinitialspace,
+        "header": header,
+        # Quoted line breaks stop pyarrow from splitting blocks in parallel, so only allow them when present
+        "newlines_in_values": any("\n" in cell or "\r" in cell for row in rows for cell in row),
+    })
+
+    names, string_columns = None, []
+    try:
+        head = pd.read_csv(io.StringIO(text), sep=sep, skipinitialspace=skipinitialspace,
+                           header=0 if header else None)
+        names = head.columns.tolist()
+        string_columns = [str(c) for c, dtype in head.dtypes.items() if dtype == object]
+    except (ValueError, pd.errors.ParserError):
+        pass
+    if not header:
+        n_columns = len(names) if names else max((len(row) for row in rows), default=1)
+        names = [f"column_{i}" for i in range(n_columns)]
+        string_columns = [f"column_{c}" for c in string_columns]
+    dialect["names"] = [str(c) for c in names] if names else None
+    dialect["string_columns"] = string_columns
+
+    _dialect_memo[memo_key] = dialect
+    return dialect
+
+
+def _csv_options(dialect):
+    options = {"sep": dialect["sep"], "encoding": dialect["encoding"],
+               "skipinitialspace": dialect["skipinitialspace"]}
+    if dialect["names"]:
+        # Replaces the header row when there is one, so names match the sniffed ones exactly
+        options.update(names=dialect["names"], header=0 if dialect["header"] else None)
+    else:
+        options["header"] = 0 if dialect["header"] else None
+    return options
+
+
+def _parse_pyarrow(stream, dialect):
+    read_options = pa_csv.ReadOptions(
+        column_names=dialect["names"], skip_rows=1 if dialect["header"] else 0,
+        encoding=dialect["encoding"], block_size=HASH_CHUNK_SIZE,
+    )
+    parse_options = pa_csv.ParseOptions(delimiter=dialect["sep"],
+                                        newlines_in_values=dialect["newlines_in_values"])
+    # Empty text cells are missing values, as with pandas
+    convert_options = pa_csv.ConvertOptions(
+        strings_can_be_null=True,
+        column_types={name: pa.string() for name in dialect["string_columns"]},
+    )
+    table = pa_csv.read_csv(stream, read_options=read_options, parse_options=parse_options,
+                            convert_options=convert_options)
+    return table.to_pandas()
+
+
+def _use_pyarrow(dialect):
+    # pyarrow has no skipinitialspace: "1, 2" would come back as text
+    return pa_csv is not None and bool(dialect["names"]) and not dialect["skipinitialspace"]
+
+
+def _parse_once(file_path, dialect, parse, memo_key):
+    # Parsers may close the stream they were given; the file itself stays open for drain()
+    with open(file_path, "rb") as f:
+        reader = _HashingReader(f)
+        df = parse(_decompressed(reader, dialect["compression"]), dialect)
+        reader.drain()
+    _remember_hash(file_path, reader.hexdigest(), memo_key)
+    return df, reader.hexdigest()
+
+
+def _parse_pandas(stream, dialect):
+    if dialect["format"] == "parquet":
+        # Parquet needs random access, so the bytes are hashed into memory and parsed from there
+        return pd.read_parquet(io.BytesIO(stream.read()))
+    return pd.read_csv(stream, **_csv_options(dialect))
+
+
+def parse_file(file_path, dialect=None):
+    """
+    Parses a whole dataset file in a single pass over its bytes, hashing
+    them on the way through. CSV goes through pyarrow's multithreaded reader
+    when available (pandas otherwise, or if pyarrow rejects the file).
+    Returns: DataFrame, content hash
+    """
+    dialect = dialect or sniff(file_path)
+    memo_key = _stat_key(file_path)
+    if dialect["format"] == "csv" and _use_pyarrow(dialect):
+        try:
+            return _parse_once(file_path, dialect, _parse_pyarrow, memo_key)
+        except pa.ArrowInvalid as e:
+            print(f"pyarrow could not parse {file_path} ({e}); retrying with pandas")
+    return _parse_once(file_path, dialect, _parse_pandas, memo_key)
+
+
+def iter_chunks(file_path, chunksize, dtype=None):
+    """
+    Yields a dataset file as DataFrames of up to chunksize rows, decompressing
+    on the fly and with the same column names read_dataset gives.
+    dtype (column -> dtype) is applied to every chunk.
+    """
+    dialect = sniff(file_path)
+    if dialect["format"] == "parquet":
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunksize):
+            chunk = batch.to_pandas()
+            yield chunk.astype(dtype) if dtype else chunk
+        return
+
+    with open(file_path, "rb") as f:
+        stream = _decompressed(f, dialect["compression"])
+        yield from pd.read_csv(stream, dtype=dtype, chunksize=chunksize, **_csv_options(dialect))
+
+
+def read_head(file_path, nrows):
+    """
+    Returns: the first nrows rows of a dataset file, parsed like read_dataset
+    """
+    for chunk in iter_chunks(file_path, nrows):
+        return chunk
+    return pd.DataFrame(columns=sniff(file_path)["names"])
+
+
+def _cache_base(cache_dir, digest):
+    return os.path.join(cache_dir, f"{digest}.v{PARSER_VERSION}")
+
+
+def _load_cached(cache_base):
+    if feather is not None and os.path.exists(f"{cache_base}.feather"):
+        # Uncompressed Feather is memory-mapped, so numeric columns are not copied on read
+        return feather.read_feather(f"{cache_base}.feather", memory_map=True)
+    if os.path.exists(f"{cache_base}.pkl"):
+        return pd.read_pickle(f"{cache_base}.pkl")
+    return None
+
+
+def _store_cached(df, cache_base):
+    if feather is not None:
+        try:
+            with atomic_path(f"{cache_base}.feather") as tmp_path:
+                feather.write_feather(df, tmp_path, compression="uncompressed")
+            return
+        except Exception:
+            pass  # mixed-type object columns can't be stored in Arrow; use pickle instead
+    with atomic_path(f"{cache_base}.pkl") as tmp_path:
+        df.to_pickle(tmp_path)
+
+
+def read_dataset(file_path, cache_dir=CACHE_DIR):
+    """
+    Reads a dataset file (CSV, optionally gzip/bz2/zip compressed, or Parquet) into a DataFrame.
+    The parsed frame is cached in a columnar binary format (Feather, or pickle
+    without pyarrow) keyed by a hash of the file's content, so every later read
+    of the same bytes skips parsing (until PARSER_VERSION changes). A file seen for the first time is hashed
+    while it is parsed, so ingesting it reads its bytes once.
+    """
+    with span("read", file=file_path) as attrs:
+        digest = _known_hash(file_path)
+        df = _load_cached(_cache_base(cache_dir, digest)) if digest else None
+        attrs["cached"] = df is not None
+        if df is None:
+            df, digest = parse_file(file_path)
+            try:
+                _store_cached(df, _cache_base(cache_dir, digest))
+            except OSError as e:
+                print(f"Could not cache {file_path}: {e}")
+        attrs["output_shape"] = shape_of(df)
+    return df
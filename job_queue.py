@@ -0,0 +1,334 @@
+import os
+import sys
+import time
+import argparse
+import sqlite3
+import subprocess
+import traceback
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from config import JOB_WORKERS, TRACE_PROFILE_DIR, EDA_WORKERS
+from ingestion import read_dataset
+from preprocessor import preprocess_data
+from trainer import train_models
+from evaluator import evaluate_models
+from model_selector import select_and_save_best_model
+from large_data import run_large_dataset
+from stage_cache import run_cached_pipeline
+from tracing import start_trace, stop_trace, set_context
+from workspace import run_workspace, cleanup_runs
+
+DB_PATH = os.path.join("jobs", "jobs.db")
+POLL_INTERVAL = 1.0
+
+# Background worker started by this process, if any (see ensure_worker)
+_worker_process = None
+
+# Job databases this process has already created or migrated (see _connect)
+_initialized = set()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dataset_name TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    target_column TEXT,
+    goal TEXT,
+    mode TEXT NOT NULL DEFAULT 'standard',
+    run_dir TEXT,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    stage TEXT,
+    error TEXT,
+    worker_pid INTEGER,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    created_at TEXT NOT NULL,
+    stage TEXT,
+    progress INTEGER,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS job_events_job_id ON job_events(job_id);
+"""
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _init_db(db_path):
+    """
+    Creates the job tables and migrates older ones, once per process and database;
+    the dashboard polls every couple of seconds and needn't repeat it.
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    with sqlite3.connect(db_path, timeout=30) as conn:
+        conn.row_factory = sqlite3.Row
+        # WAL lets the UI read the job table while workers write to it; the mode is stored in the file
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # Job tables created before large-dataset mode / run workspaces lack these columns
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "mode" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN mode TEXT NOT NULL DEFAULT 'standard'")
+        if "run_dir" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN run_dir TEXT")
+    conn.close()
+    _initialized.add(db_path)
+
+
+def _connect(db_path=DB_PATH):
+    if db_path not in _initialized:
+        _init_db(db_path)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _update_job(db_path, job_id, **fields):
+    columns = ", ".join(f"{key} = ?" for key in fields)
+    with _connect(db_path) as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def record_event(db_path, job_id, stage, progress, message=""):
+    """
+    Appends a progress event to a job and updates its current stage and progress.
+    """
+    with _connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO job_events (job_id, created_at, stage, progress, message) VALUES (?, ?, ?, ?, ?)",
+            (job_id, _now(), stage, progress, message),
+        )
+        conn.execute("UPDATE jobs SET stage = ?, progress = ? WHERE id = ?", (stage, progress, job_id))
+
+
+def list_jobs(db_path=DB_PATH, dataset_name=None, limit=50):
+    """
+    Returns the most recent jobs as dicts, newest first.
+    """
+    query = "SELECT * FROM jobs"
+    params = []
+    if dataset_name:
+        query += " WHERE dataset_name = ?"
+        params.append(dataset_name)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    with _connect(db_path) as conn:
+        return [dict(row) for row in conn.execute(query, params)]
+
+
+def get_job(job_id, db_path=DB_PATH):
+    with _connect(db_path) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_events(job_id, db_path=DB_PATH):
+    with _connect(db_path) as conn:
+        rows = conn.execute("SELECT * FROM job_events WHERE job_id = ? ORDER BY id", (job_id,))
+        return [dict(row) for row in rows]
+
+
+def trace_path_for(job_id, db_path=DB_PATH):
+    """
+    Returns: path of the per-stage timing trace recorded for a job (see tracing.py)
+    """
+    return os.path.join(os.path.dirname(db_path) or ".", "traces", f"job_{job_id}.jsonl")
+
+
+def run_job(job_id, db_path=DB_PATH, n_jobs=None):
+    """
+    Runs the AutoML pipeline for one queued job. Executes in a worker process
+    and reports every stage and every model to the job table.
+    Jobs in "large" mode run run_large_dataset instead.
+    Outputs go to a run folder of their own, recorded as the job's run_dir,
+    so jobs on the same dataset never overwrite each other's charts or report.
+    Every stage is traced to trace_path_for(job_id).
+    n_jobs is the number of cores the job may use (default: all).
+    """
+    job = get_job(job_id, db_path)
+    stage = "reading"
+    start_trace(trace_path_for(job_id, db_path), profile_dir=TRACE_PROFILE_DIR, run_id=f"job_{job_id}")
+    set_context(dataset=job["dataset_name"])
+
+    try:
+        with run_workspace(job["dataset_name"]) as run:
+            _update_job(db_path, job_id, run_dir=run["dir"])
+            _run_pipeline(job, run, db_path, n_jobs)
+        record_event(db_path, job_id, "finished", 100, "AutoML Agent completed successfully")
+        _update_job(db_path, job_id, status="finished", finished_at=_now())
+    except Exception as e:
+        # The stage callbacks keep the job row's stage current
+        stage = get_job(job_id, db_path)["stage"] or stage
+        record_event(db_path, job_id, stage, None, f"Failed: {e}")
+        _update_job(db_path, job_id, status="failed", error=traceback.format_exc(), finished_at=_now())
+    finally:
+        stop_trace()
+
+
+def _run_pipeline(job, run, db_path, n_jobs=None):
+    job_id = job["id"]
+    if job["mode"] == "large":
+        record_event(db_path, job_id, "large-dataset run", 10)
+        run_large_dataset(
+            job["file_path"], job["dataset_name"], job["goal"], target_column=job["target_column"],
+            progress=lambda message: record_event(db_path, job_id, "large-dataset run", 50, message),
+            output_base=run["output_base"], reports_dir=run["reports_dir"], models_dir=run["models_dir"],
+            scratch_dir=run["dir"], n_jobs=n_jobs,
+        )
+        return
+
+    def preprocess():
+        record_event(db_path, job_id, "reading", 5, f"Reading {job['file_path']}")
+        df = read_dataset(job["file_path"])
+        if job["target_column"]:
+            df = df[[c for c in df.columns if c != job["target_column"]] + [job["target_column"]]]
+        record_event(db_path, job_id, "preprocessing", 10)
+        return preprocess_data(df, return_pipeline=True, dataset_name=job["dataset_name"],
+                               output_base=run["output_base"], n_jobs=n_jobs or EDA_WORKERS)
+
+    def train(X, y):
+        record_event(db_path, job_id, "training", 30)
+        return train_models(
+            X, y, job["dataset_name"], n_jobs=n_jobs,
+            progress=lambda message: record_event(db_path, job_id, "training", 50, message),
+        )
+
+    def evaluate(trained_models):
+        record_event(db_path, job_id, "evaluating", 70)
+        return evaluate_models(
+            trained_models, job["dataset_name"], job["goal"],
+            progress=lambda message: record_event(db_path, job_id, "evaluating", 80, message),
+            output_base=run["output_base"], reports_dir=run["reports_dir"],
+        )
+
+    # Stages whose inputs are unchanged since an earlier job are reused
+    results, pipeline = run_cached_pipeline(
+        job["file_path"], job["dataset_name"], job["goal"], preprocess, train, evaluate,
+        target_column=job["target_column"], output_base=run["output_base"], reports_dir=run["reports_dir"],
+    )
+
+    record_event(db_path, job_id, "saving", 90)
+    select_and_save_best_model(results, pipeline, models_dir=run["models_dir"])
+
+
+def submit_job(file_path, dataset_name, goal="", target_column=None, mode="standard", db_path=DB_PATH):
+    """
+    Queues a pipeline run and returns its job id immediately, starting a
+    background worker if none is running. target_column defaults to the file's last column.
+    mode="large" trains on a sample and refits the winner on the full file (see large_data.py).
+    """
+    with _connect(db_path) as conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (dataset_name, file_path, target_column, goal, mode, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (dataset_name, file_path, target_column, goal, mode, _now()),
+        )
+        job_id = cursor.lastrowid
+    ensure_worker(db_path)
+    return job_id
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+def ensure_worker(db_path=DB_PATH):
+    """
+    Starts `python job_queue.py` as a detached background process unless one
+    is already serving this job table.
+    """
+    global _worker_process
+    # poll() also reaps a worker of ours that exited, so its pid stops looking alive
+    if _worker_process is not None and _worker_process.poll() is None:
+        return
+
+    pid_path = os.path.join(os.path.dirname(db_path) or ".", "worker.pid")
+    try:
+        with open(pid_path, "r") as f:
+            if _pid_alive(int(f.read().strip())):
+                return
+    except (OSError, ValueError):
+        pass
+
+    log = open(os.path.join(os.path.dirname(db_path) or ".", "worker.log"), "a")
+    _worker_process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--db", db_path],
+        stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+    )
+    with open(pid_path, "w") as f:
+        f.write(str(_worker_process.pid))
+
+
+def claim_next_job(db_path=DB_PATH):
+    """
+    Atomically marks the oldest queued job as running by this process.
+    Returns: job id, or None if the queue is empty
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ? WHERE id = ?",
+                (os.getpid(), _now(), row["id"]),
+            )
+        conn.commit()
+        return row["id"] if row else None
+    finally:
+        conn.close()
+
+
+def run_worker(db_path=DB_PATH, max_workers=JOB_WORKERS):
+    """
+    Serves the job table: claims queued jobs and runs up to max_workers of
+    them at once in a process pool, each with an equal share of the cores.
+    Runs until killed.
+    """
+    # Jobs whose worker died mid-run will never finish
+    with _connect(db_path) as conn:
+        for row in conn.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'").fetchall():
+            if not _pid_alive(row["worker_pid"]):
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker stopped before the job finished', "
+                    "finished_at = ? WHERE id = ?",
+                    (_now(), row["id"]),
+                )
+
+    for run_dir in cleanup_runs():
+        print(f"Removed old run {run_dir}")
+
+    # Jobs run side by side, so each gets its share of the cores rather than all of them
+    n_jobs = max(1, (os.cpu_count() or 1) // max_workers)
+    print(f"Job worker {os.getpid()} serving {db_path} with {max_workers} processes")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        running = set()
+        while True:
+            running = {future for future in running if not future.done()}
+            while len(running) < max_workers:
+                job_id = claim_next_job(db_path)
+                if job_id is None:
+                    break
+                print(f"Starting job {job_id}")
+                running.add(executor.submit(run_job, job_id, db_path, n_jobs))
+            time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued AutoML jobs in the background.")
+    parser.add_argument("--db", default=DB_PATH, help="Path to the SQLite job table")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="Jobs to run at once")
+    args = parser.parse_args()
+    run_worker(args.db, args.workers)
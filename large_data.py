@@ -0,0 +1,196 @@
+import os
+import math
+import time
+import threading
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from config import (PREPROCESS_CHUNK_SIZE, LARGE_DATA_TIME_BUDGET, LARGE_DATA_MAX_SAMPLE, LARGE_DATA_PILOT_ROWS,
+                    EDA_WORKERS)
+from preprocessor import preprocess_data, preprocess_data_chunked, _read_schema, _iter_raw_chunks
+from trainer import train_models
+from evaluator import evaluate_models
+from model_selector import select_and_save_best_model
+from model_registry import MODELS_DIR
+from workspace import append_text
+
+
+def reservoir_sample_csv(file_path, k, chunksize=PREPROCESS_CHUNK_SIZE, target_column=None, random_state=42):
+    """
+    Draws a uniform random sample of k rows from a CSV in one chunked pass.
+    Every row gets a random key and the k smallest keys are kept, so memory
+    never holds more than k rows plus one chunk.
+    Columns are named and ordered as in preprocess_data_chunked (target last).
+    Returns: sample DataFrame, total number of rows in the file
+    """
+    rng = np.random.RandomState(random_state)
+    schema = _read_schema(file_path, chunksize, target_column)
+    sample, keys = None, np.empty(0)
+    n_rows = 0
+
+    for chunk in _iter_raw_chunks(file_path, schema, chunksize):
+        n_rows += len(chunk)
+        chunk_keys = rng.random_sample(len(chunk))
+        sample = chunk if sample is None else pd.concat([sample, chunk])
+        keys = np.concatenate([keys, chunk_keys])
+        if len(keys) > k:
+            keep = np.argpartition(keys, k)[:k]
+            sample, keys = sample.iloc[keep], keys[keep]
+
+    order = np.argsort(keys)
+    return sample.iloc[order].reset_index(drop=True), n_rows
+
+
+def stratified_sample(df, n, random_state=42):
+    """
+    Takes n rows of df, keeping the class proportions of the last column when
+    it is a classification target. Falls back to a plain random sample when a
+    class is too rare to stratify on.
+    """
+    if n >= len(df):
+        return df
+    target = df.iloc[:, -1]
+    if target.dtype == "object":
+        try:
+            sample, _ = train_test_split(df, train_size=n, stratify=target, random_state=random_state)
+            return sample
+        except ValueError:
+            pass
+    return df.sample(n=n, random_state=random_state)
+
+
+def _pilot_seconds_per_row(df, dataset_name, time_budget, n_jobs=None):
+    """
+    Fits the candidate models on a few rows to estimate how training time grows with the sample.
+    """
+    pilot = df.dropna().head(LARGE_DATA_PILOT_ROWS)
+    X = StandardScaler().fit_transform(pd.get_dummies(pilot.iloc[:, :-1]).to_numpy(dtype=np.float64))
+    start = time.perf_counter()
+    # No racing: the estimate should cover full fits of every candidate
+    train_models(X, pilot.iloc[:, -1], f"{dataset_name} (pilot)", time_budget=time_budget, n_jobs=n_jobs,
+                 racing=False)
+    return (time.perf_counter() - start) / max(1, len(pilot))
+
+
+def _refit_full(model, X, y, chunk_rows):
+    """
+    Refits a fresh copy of the winning model on every row.
+    Tree ensembles are grown block by block with warm_start, each block of
+    chunk_rows rows adding its share of trees, so only one block is copied into
+    memory at a time. Other models (and classifiers whose blocks don't all
+    contain every class) fit on X in one go.
+    Returns: model, number of blocks used
+    """
+    model = clone(model)
+    params = model.get_params()
+    blocks = [slice(start, start + chunk_rows) for start in range(0, len(y), chunk_rows)]
+
+    if len(blocks) > 1 and "warm_start" in params and "n_estimators" in params:
+        n_classes = y.nunique() if y.dtype == "object" else None
+        if n_classes is None or all(y.iloc[block].nunique() == n_classes for block in blocks):
+            per_block = max(1, math.ceil(params["n_estimators"] / len(blocks)))
+            model.set_params(warm_start=True)
+            for i, block in enumerate(blocks):
+                model.set_params(n_estimators=per_block * (i + 1))
+                model.fit(X[block], y.iloc[block])
+            model.set_params(warm_start=False)
+            return model, len(blocks)
+
+    model.fit(X, y)
+    return model, 1
+
+
+def run_large_dataset(file_path, dataset_name, dataset_goal="", target_column=None,
+                      time_budget=LARGE_DATA_TIME_BUDGET, chunksize=PREPROCESS_CHUNK_SIZE, progress=None,
+                      output_base="eda_charts", reports_dir="reports", models_dir=MODELS_DIR, scratch_dir=None,
+                      n_jobs=None):
+    """
+    AutoML for files too large to train every candidate on.
+    Phase 1 runs EDA, candidate screening and model selection on a sample
+    (stratified for classification) sized so that phase fits in time_budget
+    seconds. Phase 2 refits only the winning model on the full file, streamed
+    in chunks into a memory-mapped matrix. The sample fractions and phase
+    timings are appended to the evaluation report.
+    progress, if given, is called with a message as each phase starts.
+    Charts, report and model go under output_base, reports_dir and models_dir;
+    the full matrix is written to scratch_dir (a run's folder, see workspace.py;
+    default: next to file_path) and removed once the refit ends or fails.
+    n_jobs is the number of cores the run may use (default: all).
+    Returns: path of the evaluation report
+    """
+    def report(message):
+        print(message)
+        if progress:
+            progress(message)
+
+    timings = {}
+    start = time.perf_counter()
+    report(f"Sampling up to {LARGE_DATA_MAX_SAMPLE} rows from {file_path}")
+    pool, n_rows = reservoir_sample_csv(file_path, LARGE_DATA_MAX_SAMPLE, chunksize, target_column)
+    timings["Sampling"] = time.perf_counter() - start
+
+    # Half the budget goes to fitting; EDA and evaluation take the rest
+    start = time.perf_counter()
+    seconds_per_row = _pilot_seconds_per_row(pool, dataset_name, time_budget, n_jobs)
+    n_sample = max(LARGE_DATA_PILOT_ROWS, int(time_budget / 2 / seconds_per_row)) if time_budget else len(pool)
+    sample = stratified_sample(pool, min(n_sample, len(pool)))
+    del pool
+    timings["Pilot fit"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report(f"Screening candidates on {len(sample)} of {n_rows} rows")
+    X, y, _ = preprocess_data(sample, return_pipeline=True, dataset_name=dataset_name, output_base=output_base,
+                              n_jobs=n_jobs or EDA_WORKERS)
+    remaining = time_budget - sum(timings.values()) if time_budget else None
+    trained_models = train_models(X, y, dataset_name, time_budget=max(1.0, remaining) if remaining is not None else None,
+                                  n_jobs=n_jobs)
+    results = evaluate_models(trained_models, dataset_name, dataset_goal, output_base=output_base,
+                              reports_dir=reports_dir)
+    best = max(results, key=lambda result: result[3])
+    timings["Sample phase (EDA, screening, selection)"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report(f"Refitting {best[1]} on all {n_rows} rows")
+    # Scratch matrix private to this run, so concurrent runs on one file don't share it
+    scratch_dir = scratch_dir or os.path.dirname(os.path.abspath(file_path))
+    X_path = os.path.join(scratch_dir, f"{os.getpid()}_{threading.get_ident()}_X.npy")
+    try:
+        X_full, y_full, pipeline = preprocess_data_chunked(
+            file_path, chunksize, output_path=X_path, return_pipeline=True,
+            target_column=target_column, dataset_name=dataset_name, eda=False,
+        )
+        timings["Full-data preprocessing"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        model, n_blocks = _refit_full(best[2], X_full, y_full, chunksize)
+        timings["Full-data refit"] = time.perf_counter() - start
+
+        ds_name, name, _, score, X_test, y_test, info = best
+        info = dict(info, fit_time=timings["Full-data refit"])
+        select_and_save_best_model([(ds_name, name, model, score, X_test, y_test, info)], pipeline, models_dir)
+        n_complete = len(y_full)
+        del X_full
+    finally:
+        # The matrix can be several GB; a failed refit mustn't leave it behind
+        if os.path.exists(X_path):
+            os.remove(X_path)
+
+    report_path = os.path.join(reports_dir, f"{dataset_name.replace(' ', '_').lower()}_report.txt")
+    lines = [
+        "\n----- Large-dataset mode -----",
+        f"Total rows: {n_rows}",
+        f"Complete rows used for the refit: {n_complete}",
+        f"Screening sample: {len(sample)} rows ({len(sample) / n_rows:.2%} of the file)",
+        f"Screening score on the sample's test split: {round(score, 4)}",
+        f"Refit model: {name}, trained on 100% of complete rows in {n_blocks} block(s)",
+        "Phase timings:",
+        *(f"  - {phase}: {seconds:.2f}s" for phase, seconds in timings.items()),
+        "=============================================",
+    ]
+    append_text(report_path, "\n".join(lines) + "\n")
+
+    report(f"Large-dataset run finished in {sum(timings.values()):.2f}s")
+    return report_path
@@ -1,23 +1,145 @@
-from data_collector import download_dataset
-from preprocessor import preprocess_data
+import argparse
+import contextlib
+import io
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from data_collector import download_dataset, download_datasets
+from preprocessor import preprocess_data, preprocess_data_chunked
 from trainer import train_models
 from evaluator import evaluate_models
 from model_selector import select_and_save_best_model
-from config import DATASET_SOURCES
+from stage_cache import run_cached_pipeline
+from tracing import start_trace, set_context, read_trace, summarize
+from workspace import run_workspace, cleanup_runs
+from config import DATASET_SOURCES, MAX_WORKERS, STREAMING_THRESHOLD_MB, TRACE_PROFILE_DIR, EDA_WORKERS
+
+
+def run_dataset(dataset_cfg, file_path=None, n_jobs=None):
+    """
+    Runs the full pipeline (download, preprocess, train, evaluate, save) for one dataset.
+    If file_path is given, the dataset was already downloaded and that step is skipped.
+    n_jobs is the number of cores the pipeline may use (default: all).
+    Charts, report and model are written to a new run folder (see workspace.py),
+    published as the dataset's latest once the run succeeds.
+    Output is captured so pipelines running in parallel don't interleave.
+    Returns: dataset_name, status, elapsed_seconds, log
+    """
+    log = io.StringIO()
+    start = time.perf_counter()
+    set_context(dataset=dataset_cfg["name"])
+
+    with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            if file_path:
+                dataset_name = dataset_cfg["name"]
+                dataset_goal = dataset_cfg.get("goal", "No goal specified")
+            else:
+                file_path, dataset_name, dataset_goal = download_dataset(dataset_cfg["name"])
+            if file_path:
+                with run_workspace(dataset_name) as run:
+                    # Too big to load whole: stream it into a memory-mapped matrix in the run's folder
+                    streamed = os.path.getsize(file_path) > STREAMING_THRESHOLD_MB * 1024 * 1024
+                    X_path = os.path.join(run["dir"], "X.npy")
+                    if streamed:
+                        preprocess = lambda: preprocess_data_chunked(
+                            file_path, output_path=X_path, return_pipeline=True, dataset_name=dataset_name,
+                            output_base=run["output_base"], n_jobs=n_jobs or EDA_WORKERS,
+                        )
+                    else:
+                        preprocess = lambda: preprocess_data(
+                            file_path, return_pipeline=True, dataset_name=dataset_name,
+                            output_base=run["output_base"], n_jobs=n_jobs or EDA_WORKERS,
+                        )
+                    results, pipeline = run_cached_pipeline(
+                        file_path, dataset_name, dataset_goal, preprocess,
+                        train=lambda X, y: train_models(X, y, dataset_name, n_jobs=n_jobs),
+                        evaluate=lambda trained_models: evaluate_models(
+                            trained_models, dataset_name, dataset_goal,
+                            output_base=run["output_base"], reports_dir=run["reports_dir"],
+                        ),
+                        streamed=streamed, output_base=run["output_base"], reports_dir=run["reports_dir"],
+                    )
+                    select_and_save_best_model(results, pipeline, models_dir=run["models_dir"])
+                    if os.path.exists(X_path):
+                        os.remove(X_path)  # the test split was copied out; the full matrix isn't kept
+                status = "ok"
+            else:
+                print(f"Dataset {dataset_cfg['name']} not available")
+                status = "unavailable"
+        except Exception:
+            traceback.print_exc()
+            status = "failed"
+
+    return dataset_cfg["name"], status, time.perf_counter() - start, log.getvalue()
+
 
-def run_agent():
+def run_agent(max_workers=MAX_WORKERS, trace=False, profile_dir=TRACE_PROFILE_DIR):
+    """
+    Runs every dataset in DATASET_SOURCES, each pipeline in its own worker process
+    and with an equal share of the cores. A failing dataset does not stop the others. Ends with a per-dataset summary.
+    With trace=True every stage is recorded as a span in traces/<run>.jsonl
+    (see tracing.py), and with profile_dir also profiled with cProfile.
+    """
     print("\nStarting AutoML Agent...\n")
+    start = time.perf_counter()
+    trace_path = start_trace(profile_dir=profile_dir) if trace else None
+    summary = []
+    for run_dir in cleanup_runs():
+        print(f"Removed old run {run_dir}")
 
-    for dataset_cfg in DATASET_SOURCES:
-        file_path, dataset_name, dataset_goal = download_dataset(dataset_cfg["name"])
-        if file_path:
-            X, y = preprocess_data(file_path)
-            trained_models = train_models(X, y, dataset_name)
-            results = evaluate_models(trained_models, dataset_name, dataset_goal)
-            select_and_save_best_model(results)
+    # Fetch every dataset up front over pooled connections; unchanged files are reused
+    downloads = download_datasets([cfg["name"] for cfg in DATASET_SOURCES])
+    file_paths = [file_path for file_path, _, _ in downloads]
+
+    # Pipelines run side by side, so each gets its share of the cores rather than all of them
+    n_cpus = os.cpu_count() or 1
+    n_jobs = max(1, n_cpus // min(max_workers or n_cpus, len(DATASET_SOURCES)))
+
+    if max_workers == 1:
+        for dataset_cfg, file_path in zip(DATASET_SOURCES, file_paths):
+            name, status, elapsed, log = run_dataset(dataset_cfg, file_path, n_jobs)
+            print(log, end="")
             print("\n-----------------------------\n")
-        else:
-            print(f"Dataset {dataset_name} not available")
+            summary.append((name, status, elapsed))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(run_dataset, cfg, file_path, n_jobs): cfg["name"]
+                for cfg, file_path in zip(DATASET_SOURCES, file_paths)
+            }
+            for future in as_completed(futures):
+                try:
+                    name, status, elapsed, log = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. killed for running out of memory)
+                    name, status, elapsed, log = futures[future], "crashed", 0.0, f"Worker crashed: {e}\n"
+                print(log, end="")
+                print("\n-----------------------------\n")
+                summary.append((name, status, elapsed))
+
+    total = time.perf_counter() - start
+    print("========== AutoML Agent Summary ==========")
+    for name, status, elapsed in sorted(summary):
+        print(f"{name:<40} {status:<12} {elapsed:8.1f}s")
+    succeeded = sum(1 for _, status, _ in summary if status == "ok")
+    print(f"\n{succeeded}/{len(summary)} datasets succeeded in {total:.1f}s wall-clock")
+
+    if trace_path:
+        print(f"\nTrace saved to {trace_path}; slowest stages:")
+        for entry in summarize(read_trace(trace_path))[:10]:
+            print(f"{entry['stage']:<40} {entry['calls']:>4}x {entry['wall_s']:8.1f}s wall {entry['cpu_s']:8.1f}s CPU")
+    return summary
+
 
 if __name__ == "__main__":
-    run_agent()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the AutoML Agent over every configured dataset.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="Number of datasets to process in parallel (default: one per CPU core)")
+    parser.add_argument("--trace", action="store_true", help="Record per-stage timing spans under traces/")
+    parser.add_argument("--profile-dir", default=TRACE_PROFILE_DIR,
+                        help="With --trace, also write a cProfile dump per stage to this directory")
+    args = parser.parse_args()
+    run_agent(max_workers=args.workers, trace=args.trace, profile_dir=args.profile_dir)
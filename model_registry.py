@@ -0,0 +1,146 @@
+import os
+import json
+import sqlite3
+import argparse
+import joblib
+from datetime import datetime
+
+from config import MODEL_COMPRESS
+from ingestion import file_hash
+from workspace import atomic_path
+
+MODELS_DIR = "models"
+REGISTRY_PATH = os.path.join(MODELS_DIR, "registry.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dataset_name TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    score REAL,
+    metric TEXT,
+    params TEXT,
+    file_path TEXT NOT NULL UNIQUE,
+    file_size INTEGER,
+    content_hash TEXT,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_dataset_name ON models(dataset_name);
+"""
+
+
+def model_params(model):
+    """
+    Returns: hyperparameters of a trained model (of its final step, for the binned Pipeline)
+    """
+    # Duck-typed, so looking up the registry never has to import the training code
+    return (model.steps[-1][1] if hasattr(model, "steps") else model).get_params()
+
+
+def _connect(registry_path=REGISTRY_PATH):
+    os.makedirs(os.path.dirname(registry_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(registry_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def save_artifact(artifact, file_path):
+    """
+    Writes an artifact with joblib, compressed at MODEL_COMPRESS, and renames
+    it into place once complete. Large forests are compressed too: memory-mapping
+    them would not share pages between processes, since sklearn copies every
+    tree's node arrays when it unpickles them.
+    Returns: True if the file was compressed
+    """
+    compressed = bool(MODEL_COMPRESS)
+    with atomic_path(file_path) as tmp_path:
+        joblib.dump(artifact, tmp_path, compress=MODEL_COMPRESS)
+    return compressed
+
+
+def register_model(file_path, dataset_name, model_name, score=None, metric=None, params=None,
+                   compressed=False, registry_path=REGISTRY_PATH):
+    """
+    Adds or updates the index entry for a saved artifact.
+    """
+    params_json = json.dumps(params or {}, default=str)
+    with _connect(registry_path) as conn:
+        conn.execute(
+            "INSERT INTO models (dataset_name, model_name, score, metric, params, file_path, file_size, "
+            "content_hash, compressed, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(file_path) DO UPDATE SET dataset_name = excluded.dataset_name, "
+            "model_name = excluded.model_name, score = excluded.score, metric = excluded.metric, "
+            "params = excluded.params, file_size = excluded.file_size, content_hash = excluded.content_hash, "
+            "compressed = excluded.compressed, created_at = excluded.created_at",
+            (dataset_name, model_name, score, metric, params_json, file_path, os.path.getsize(file_path),
+             file_hash(file_path), int(compressed), datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+        )
+
+
+def list_models(dataset_name=None, registry_path=REGISTRY_PATH):
+    """
+    Returns index entries (newest first) without loading any artifact.
+    dataset_name matches the name the model was saved under, case and spacing insensitive.
+    """
+    query = "SELECT * FROM models"
+    params = []
+    if dataset_name:
+        query += " WHERE lower(replace(dataset_name, ' ', '_')) = ?"
+        params.append(dataset_name.replace(" ", "_").lower())
+    query += " ORDER BY created_at DESC, id DESC"
+    with _connect(registry_path) as conn:
+        rows = [dict(row) for row in conn.execute(query, params)]
+    for row in rows:
+        row["params"] = json.loads(row["params"] or "{}")
+    # Drop entries whose file was deleted by hand
+    return [row for row in rows if os.path.exists(row["file_path"])]
+
+
+def load_artifact(model_path):
+    """
+    Loads a saved model artifact.
+    Files holding a bare estimator (saved before pipelines were stored) are
+    wrapped in the same dict layout with no pipeline.
+    """
+    artifact = joblib.load(model_path)
+    if not isinstance(artifact, dict):
+        artifact = {"model": artifact, "pipeline": None, "feature_columns": None}
+    return artifact
+
+
+def index_existing_models(models_dir=MODELS_DIR, registry_path=REGISTRY_PATH):
+    """
+    Registers .pkl/.joblib files in models_dir that aren't in the index yet
+    (e.g. saved before the registry existed). Each is loaded once to read its metadata.
+    """
+    with _connect(registry_path) as conn:
+        known = {row["file_path"] for row in conn.execute("SELECT file_path FROM models")}
+    for file_name in sorted(os.listdir(models_dir)):
+        file_path = os.path.join(models_dir, file_name)
+        if not file_name.endswith(('.pkl', '.joblib')) or file_path in known:
+            continue
+        artifact = load_artifact(file_path)
+        register_model(
+            file_path,
+            artifact.get("dataset_name") or os.path.splitext(file_name)[0],
+            artifact.get("model_name") or type(artifact["model"]).__name__,
+            score=artifact.get("score"),
+            metric=artifact.get("metric"),
+            params=model_params(artifact["model"]),
+            registry_path=registry_path,
+        )
+        print(f"Indexed {file_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model registry maintenance.")
+    parser.add_argument("--reindex", action="store_true", help="Index model files missing from the registry")
+    args = parser.parse_args()
+    if args.reindex:
+        index_existing_models()
+    for entry in list_models():
+        print(f"{entry['created_at']}  {entry['dataset_name']:<30} {entry['model_name']:<28} "
+              f"{entry['metric'] or '':<10} {entry['score']!s:<20} {entry['file_size']:>10} B  {entry['file_path']}")
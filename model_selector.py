@@ -1,19 +1,41 @@
-import joblib
 import os
+from datetime import datetime
+from model_registry import MODELS_DIR, save_artifact, register_model, model_params
+from tracing import span
 
-def select_and_save_best_model(results):
+def select_and_save_best_model(results, pipeline=None, models_dir=MODELS_DIR):
     """
-    Selects the best model (highest score) and saves it.
+    Selects the best model (highest score) and saves it in models_dir.
+    If the fitted PreprocessingPipeline is given it is saved with the model,
+    so the artifact can score new raw rows on its own (see scorer.py).
+    Returns: path of the saved artifact
     """
-    # results = list of tuples: (dataset_name, model_name, model, score, X_test, y_test)
+    # results = list of tuples: (dataset_name, model_name, model, score, X_test, y_test, info)
     best_model = sorted(results, key=lambda x: x[3], reverse=True)[0]  # sort by score
 
-    dataset_name, model_name, model, score, _, _ = best_model
+    dataset_name, model_name, model, score, _, _, info = best_model
 
     # Save the model
-    os.makedirs("models", exist_ok=True)
     safe_name = f"{dataset_name.replace(' ', '_').lower()}_{model_name.replace(' ', '_').lower()}.pkl"
-    joblib.dump(model, f"models/{safe_name}")
+    model_path = os.path.join(models_dir, safe_name)
+    artifact = {
+        "model": model,
+        "pipeline": pipeline,
+        "dataset_name": dataset_name,
+        "model_name": model_name,
+        "score": score,
+        "metric": info.get("metric"),
+        "fit_time": info.get("fit_time"),
+        "feature_columns": pipeline.feature_columns if pipeline is not None else None,
+        "saved_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    with span("save", model=model_name) as attrs:
+        compressed = save_artifact(artifact, model_path)
+        register_model(model_path, dataset_name, model_name, score=score, metric=info.get("metric"),
+                       params=model_params(model), compressed=compressed)
+        attrs["bytes"] = os.path.getsize(model_path)
 
     print(f"\nBest model: {model_name} (Score: {round(score, 4)}) for dataset '{dataset_name}'")
-    print(f"Model saved to models/{safe_name}")
\ No newline at end of file
+    print(f"Model saved to {model_path}")
+    return model_path
+
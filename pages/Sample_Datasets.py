@@ -1,27 +1,32 @@
 import streamlit as st
 import pandas as pd
 import os
-import requests
-import tempfile
-import shutil
-import joblib
+from pathlib import Path
 
 from config import DATASET_SOURCES
-from preprocessor import preprocess_data
-from trainer import train_models
-from evaluator import evaluate_models
-from model_selector import select_and_save_best_model
+from data_collector import download_dataset
+from ingestion import read_dataset, file_hash
+from job_queue import submit_job, list_jobs, get_job, get_events, trace_path_for
+from tracing import read_trace, summarize
+from model_registry import list_models
+from workspace import output_paths, load_run
 
 st.set_page_config(page_title="Sample Datasets", layout="wide")
 st.title("Sample Datasets")
 
+# -------------------- Cached stages --------------------
+# Keyed by the dataset's content hash so widget reruns don't re-parse it.
+@st.cache_data(show_spinner=False)
+def load_dataset(path, content_hash):
+    return read_dataset(path)
+
+
 # -------------------- Session state --------------------
 if 'active_sample_dataset' not in st.session_state:
     st.session_state['active_sample_dataset'] = None
 
 # Sample datasets
 SAMPLE_DATASET_NAMES = [d["name"] for d in DATASET_SOURCES]
-SAMPLE_DATASET_URLS = {d["name"]: d["url"] for d in DATASET_SOURCES}
 DATASET_GOALS = {d["name"]: d.get("goal", "") for d in DATASET_SOURCES}
 
 st.sidebar.markdown("### Sample Datasets")
@@ -32,13 +37,9 @@ sample_path = os.path.join("data", f"{safe_name}.csv")
 
 # Download dataset if not present
 if not os.path.exists(sample_path):
-    try:
-        response = requests.get(SAMPLE_DATASET_URLS[sample_choice], verify=False, timeout=20)
-        response.raise_for_status()
-        with open(sample_path, "wb") as f:
-            f.write(response.content)
-    except Exception as e:
-        st.error(f"Could not download dataset: {e}")
+    downloaded_path, _, _ = download_dataset(sample_choice)
+    if not downloaded_path:
+        st.error(f"Could not download dataset: {sample_choice}")
         st.stop()
 
 st.session_state['active_sample_dataset'] = sample_path
@@ -61,38 +62,65 @@ st.sidebar.markdown("""
 
 train_clicked = st.sidebar.button("Run AutoML Agent")
 
-if not train_clicked:
-    st.info("Select a sample dataset, then click **Run AutoML Agent**.")
+if train_clicked:
+    dataset_to_use = st.session_state['active_sample_dataset']
+    st.session_state['active_sample_job_id'] = submit_job(
+        dataset_to_use,
+        os.path.basename(dataset_to_use).rsplit(".", 1)[0],
+        goal=dataset_goal,
+    )
+
+# -------------------- AutoML Jobs --------------------
+@st.fragment(run_every=2)
+def show_jobs():
+    """
+    Polls the job table; redraws only this panel until the active job ends.
+    """
+    jobs = list_jobs()
+    if jobs:
+        st.dataframe(
+            pd.DataFrame(jobs)[["id", "dataset_name", "status", "stage", "progress", "created_at", "finished_at"]],
+            hide_index=True,
+        )
+
+    job_id = st.session_state.get('active_sample_job_id')
+    job = get_job(job_id) if job_id else None
+    if not job:
+        return
+    st.progress(job["progress"], text=f"Job {job_id}: {job['status']} ({job['stage'] or 'queued'})")
+    for event in get_events(job_id)[-5:]:
+        if event["message"]:
+            st.caption(f"{event['created_at']} [{event['stage']}] {event['message']}")
+
+    # Redraw the whole page once, when the job ends, to show its results
+    if job["status"] in ("finished", "failed") and st.session_state.get('rendered_sample_job_id') != job_id:
+        st.rerun()
+
+
+# A job that has ended is rendered by this run, so the poller mustn't trigger another
+active_job = get_job(st.session_state['active_sample_job_id']) if st.session_state.get('active_sample_job_id') else None
+if active_job and active_job["status"] in ("finished", "failed"):
+    st.session_state['rendered_sample_job_id'] = active_job["id"]
+
+st.subheader("AutoML Jobs")
+show_jobs()
+
+if not active_job or active_job["status"] not in ("finished", "failed"):
+    if not active_job:
+        st.info("Select a sample dataset, then click **Run AutoML Agent**.")
+    st.stop()
+
+if active_job["status"] == "failed":
+    st.error(f"AutoML run failed:\n\n{active_job['error']}")
     st.stop()
 
-# -------------------- Run pipeline --------------------
-dataset_to_use = st.session_state['active_sample_dataset']
-display_name = os.path.basename(dataset_to_use).rsplit(".", 1)[0]
-
-tmp_dir = tempfile.mkdtemp()
-work_file = os.path.join(tmp_dir, f"{display_name}_tmp.csv")
-shutil.copy(dataset_to_use, work_file)
-
-st.subheader("AutoML Progress")
-progress = st.progress(0)
-
-with st.spinner("Running AutoML Agent..."):
-    try:
-        progress.progress(10)
-        X, y = preprocess_data(work_file)
-        progress.progress(40)
-        trained_models = train_models(X, y, display_name)
-        progress.progress(70)
-        results = evaluate_models(trained_models, display_name, dataset_goal)
-        progress.progress(90)
-        select_and_save_best_model(results)
-        progress.progress(100)
-        st.success("AutoML Agent completed successfully ")
-    finally:
-        shutil.rmtree(tmp_dir)
+dataset_to_use = active_job["file_path"]
+display_name = active_job["dataset_name"]
+safe_name = display_name
+df = load_dataset(dataset_to_use, file_hash(dataset_to_use))
+st.success("AutoML Agent completed successfully ")
 
 # -------------------- Display results --------------------
-df = pd.read_csv(dataset_to_use)
 st.subheader("Dataset Preview")
 st.write(f"**{display_name}**")
 st.write(f"Rows: {df.shape[0]}, Columns: {df.shape[1]}")
@@ -101,14 +129,26 @@ st.write(df.describe())
 st.write(df.isnull().sum())
 
 st.subheader("Training Report")
-report_path = os.path.join("reports", f"{display_name.replace(' ','_').lower()}_report.txt")
+# This job's own run folder, so another run of the same dataset can't swap its outputs
+outputs = output_paths(display_name, run=load_run(active_job["run_dir"]))
+report_path = outputs["report"]
 if os.path.exists(report_path):
     with open(report_path, "r") as f:
         st.text(f.read())
 
+# -------------------- Timing breakdown --------------------
+st.subheader("Timing Breakdown")
+trace_path = trace_path_for(active_job["id"])
+if os.path.exists(trace_path):
+    stages = pd.DataFrame(summarize(read_trace(trace_path)))
+    st.bar_chart(stages.set_index("stage")["wall_s"], horizontal=True)
+    st.dataframe(stages, hide_index=True)
+else:
+    st.info("No timing trace recorded for this run.")
+
 # -------------------- Pre-training EDA Charts --------------------
 st.subheader("Pre-training EDA Charts")
-pre_training_path = os.path.join("eda_charts", safe_name, "pre_training")
+pre_training_path = outputs["pre_training"]
 if os.path.exists(pre_training_path):
     pre_training_images = [f for f in os.listdir(pre_training_path) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
     for img_file in pre_training_images:
@@ -116,7 +156,7 @@ if os.path.exists(pre_training_path):
 
 # -------------------- Post-training EDA Charts --------------------
 st.subheader("Post-training EDA Charts")
-post_training_path = os.path.join("eda_charts", safe_name, "post_training")
+post_training_path = outputs["post_training"]
 if os.path.exists(post_training_path):
     post_training_images = [f for f in os.listdir(post_training_path) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
     for img_file in post_training_images:
@@ -124,24 +164,23 @@ if os.path.exists(post_training_path):
 
 # -------------------- Trained Models --------------------
 st.subheader("Trained Models")
-model_files = [f for f in os.listdir("models") if f.startswith(safe_name) and f.endswith(('.pkl', '.joblib'))]
-if not model_files:
+# Listing reads the registry index only; no model file is unpickled
+registered_models = list_models(safe_name)
+if not registered_models:
     st.write("No trained models found for this dataset in the models/ directory.")
 else:
-    for model_file in model_files:
+    st.dataframe(
+        pd.DataFrame(registered_models)[["model_name", "metric", "score", "file_size", "created_at", "content_hash"]],
+        hide_index=True,
+    )
+    for entry in registered_models:
+        model_file = os.path.basename(entry["file_path"])
         st.markdown(f"### Model: {model_file}")
-        model_path = os.path.join("models", model_file)
-        try:
-            model = joblib.load(model_path)
-            st.write(model)
-        except Exception as e:
-            st.write(f"Could not load model {model_file}: {e}")
-            continue
-
-        with open(model_path, "rb") as file:
-            st.download_button(
-                label=f"Download Model {model_file}",
-                data=file,
-                file_name=model_file,
-                mime="application/octet-stream"
-            )
\ No newline at end of file
+        st.write(entry["params"])
+        st.download_button(
+            label=f"Download Model {model_file}",
+            data=lambda path=entry["file_path"]: Path(path).read_bytes(),
+            file_name=model_file,
+            mime="application/octet-stream",
+            key=f"download_{entry['id']}"
+        )
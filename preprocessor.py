@@ -1,78 +1,756 @@
 import pandas as pd
+import numpy as np
+from scipy import sparse
 from sklearn.preprocessing import StandardScaler
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_selection import f_classif, f_regression
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import json
+import hashlib
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from ingestion import read_dataset, read_head, iter_chunks
+from tracing import span, shape_of
+from workspace import atomic_path, write_json
+from config import (PREPROCESS_CHUNK_SIZE, EDA_WORKERS, EDA_FAST_MODE_ROWS, EDA_SAMPLE_ROWS,
+                    ENCODING, SPARSE_MIN_DUMMIES, ONEHOT_MAX_CARDINALITY, HASH_WIDTH, COMPACT_DTYPES,
+                    COMPACT_CATEGORY_RATIO, SCREENING, SCREEN_UNIQUE_RATIO, SCREEN_MIN_CATEGORY_ROWS,
+                    SCREEN_MAX_CORRELATION, SCREEN_MAX_FEATURES)
 
-def perform_pre_training_eda(df, dataset_name):
+# Bucket shared by the rare categories of a screened high-cardinality column
+OTHER_CATEGORY = "__other__"
+
+
+def _render_chart(task):
+    """
+    Draws and saves one EDA figure. Runs in an EDA worker process.
+    """
+    kind, data, path = task
+    if kind == "heatmap":
+        plt.figure(figsize=(12, 10))
+        sns.heatmap(data, annot=True, fmt=".2f", cmap='coolwarm', square=True)
+        plt.title('Correlation Heatmap')
+    elif kind == "histogram":
+        plt.figure(figsize=(8, 6))
+        sns.histplot(data, kde=True)
+        plt.title(f'Histogram of {data.name}')
+    else:
+        plt.figure(figsize=(8, 6))
+        sns.boxplot(x=data)
+        plt.title(f'Boxplot of {data.name}')
+    with atomic_path(path) as tmp_path:
+        plt.savefig(tmp_path)
+    plt.close()
+    return path
+
+
+def _frame_hash(data, kind):
+    digest = hashlib.sha256(kind.encode())
+    digest.update(repr(list(data.columns) if hasattr(data, "columns") else data.name).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def perform_pre_training_eda(df, dataset_name, n_jobs=EDA_WORKERS, fast=None, output_base="eda_charts"):
+    """
+    Saves a histogram (with KDE) and a boxplot per numeric column plus a
+    correlation heatmap under <output_base>/<dataset_name>/pre_training/.
+    Summary statistics for all numeric columns are computed in one pass and
+    saved as summary_statistics.csv. Figures are rendered in n_jobs worker
+    processes, and a figure whose input data hashes to the value recorded
+    in the folder's manifest is not redrawn.
+    fast (default: when the dataset has more than EDA_FAST_MODE_ROWS rows) draws
+    the histograms and heatmap from a sample of EDA_SAMPLE_ROWS rows.
+    Returns: the summary statistics DataFrame (empty without numeric columns),
+    the correlation matrix behind the heatmap (None without numeric columns)
+    """
     # Clean dataset name for folder
     safe_name = dataset_name.replace(" ", "_").lower()
-    save_dir = os.path.join("eda_charts", safe_name, "pre_training")
+    save_dir = os.path.join(output_base, safe_name, "pre_training")
     os.makedirs(save_dir, exist_ok=True)
 
     # Select numeric columns
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+    numeric = df[numeric_cols]
 
-    # Histograms
-    for col in numeric_cols:
-        plt.figure(figsize=(8, 6))
-        sns.histplot(df[col].dropna(), kde=True)
-        plt.title(f'Histogram of {col}')
-        plt.savefig(f"{save_dir}/histogram_{col}.png")
-        plt.close()
+    # All-categorical datasets (e.g. Car Evaluation) have nothing to describe or chart
+    if not numeric_cols:
+        return pd.DataFrame(), None
+
+    # Summary statistics for every column in one vectorised pass
+    summary = numeric.describe().T
+    summary["missing"] = numeric.isna().sum()
+    with atomic_path(os.path.join(save_dir, "summary_statistics.csv")) as tmp_path:
+        summary.to_csv(tmp_path)
 
-    # Boxplots
+    if fast is None:
+        fast = len(df) > EDA_FAST_MODE_ROWS
+    sampled = numeric.sample(n=EDA_SAMPLE_ROWS, random_state=42) if fast and len(df) > EDA_SAMPLE_ROWS else numeric
+
+    tasks = []
     for col in numeric_cols:
-        plt.figure(figsize=(8, 6))
-        sns.boxplot(x=df[col].dropna())
-        plt.title(f'Boxplot of {col}')
-        plt.savefig(f"{save_dir}/boxplot_{col}.png")
-        plt.close()
+        tasks.append(("histogram", sampled[col].dropna(), os.path.join(save_dir, f"histogram_{col}.png")))
+        tasks.append(("boxplot", numeric[col].dropna(), os.path.join(save_dir, f"boxplot_{col}.png")))
+    correlation = sampled.corr()
+    tasks.append(("heatmap", correlation, os.path.join(save_dir, "correlation_heatmap.png")))
 
-    # Correlation heatmap
-    if numeric_cols:
-        plt.figure(figsize=(12, 10))
-        corr = df[numeric_cols].corr()
-        sns.heatmap(corr, annot=True, fmt=".2f", cmap='coolwarm', square=True)
-        plt.title('Correlation Heatmap')
-        plt.savefig(f"{save_dir}/correlation_heatmap.png")
-        plt.close()
+    # Skip figures whose input is unchanged since they were last drawn
+    manifest_path = os.path.join(save_dir, ".eda_manifest.json")
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    hashes = {path: _frame_hash(data, kind) for kind, data, path in tasks}
+    tasks = [task for task in tasks if not (os.path.exists(task[2]) and manifest.get(task[2]) == hashes[task[2]])]
 
+    if len(tasks) > 1 and n_jobs != 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(_render_chart, tasks))
+    else:
+        for task in tasks:
+            _render_chart(task)
 
-def preprocess_data(file_path):
-    print("\nStarting data preprocessing...\n")
+    write_json(manifest_path, hashes)
+
+    return summary, correlation
+
+
+def compact_dtypes(df, exclude=(), category_ratio=COMPACT_CATEGORY_RATIO):
+    """
+    Downcasts a frame's columns: integers to the smallest integer type that
+    holds them, floats to float32 (unless their values overflow it) and string
+    columns with fewer than category_ratio * rows distinct values to category.
+    Columns in exclude (e.g. the target) are left as they are.
+    Returns: the compacted DataFrame
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col in exclude:
+            columns[col] = series
+        elif pd.api.types.is_integer_dtype(series.dtype) and isinstance(series.dtype, np.dtype):
+            columns[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series.dtype) and series.dtype.itemsize > 4 and \
+                not (series.abs() > np.finfo(np.float32).max).any():
+            columns[col] = series.astype(np.float32)
+        elif (pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)) and \
+                series.nunique() < category_ratio * len(series):
+            columns[col] = series.astype("category")
+        else:
+            columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
 
-    # Try reading CSV with comma, fallback to semicolon
-    try:
-        df = pd.read_csv(file_path)
-        if len(df.columns) == 1:
-            df = pd.read_csv(file_path, sep=';')
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return None, None
 
-    # Handle missing headers
-    if df.columns.tolist()[0].startswith("Unnamed"):
-        df.columns = [f"column_{i}" for i in range(len(df.columns))]
+def category_values(series):
+    """
+    Categorical columns are fitted on the strings read from a CSV, but new rows
+    can arrive with the same values parsed as numbers (a chunk with no "5more"
+    in it, or JSON numbers). Numbers are turned back into the strings they were
+    read from, e.g. 2 and 2.0 into "2"; missing values stay missing.
+    Returns: the series, with numeric values as strings
+    """
+    if not (pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype)):
+        return series
+    if pd.api.types.is_float_dtype(series.dtype) and (series.dropna() % 1 == 0).all():
+        series = series.astype("Int64")
+    strings = series.astype("string").astype(object)
+    return strings.where(series.notna(), np.nan)
+
+
+def _apply_buckets(df, buckets):
+    """
+    Moves every category outside a bucketed column's kept set into OTHER_CATEGORY.
+    Missing values stay missing.
+    """
+    if not buckets:
+        return df
+    df = df.copy(deep=False)
+    for col, kept in buckets.items():
+        values = category_values(df[col]).astype(object)
+        df[col] = values.where(values.isin(kept) | values.isna(), OTHER_CATEGORY).astype("category")
+    return df
+
+
+def screen_features(X, y, correlation=None, unique_ratio=SCREEN_UNIQUE_RATIO,
+                    min_category_rows=SCREEN_MIN_CATEGORY_ROWS, max_correlation=SCREEN_MAX_CORRELATION):
+    """
+    Removes features that only cost fit and predict time:
+      - constant columns;
+      - ID-like integer columns (all distinct and increasing row by row);
+      - string columns with more than unique_ratio * rows distinct values
+        (names, tickets, free text): their categories seen in at least
+        min_category_rows rows are kept and the rest bucketed together, or
+        the column is dropped if no category is that common;
+      - of two numeric features whose correlation (the EDA's matrix) exceeds
+        max_correlation, the one less correlated with a numeric target.
+    If that would drop every column, X is returned unscreened.
+    Returns: screened X, {"dropped": {column: reason}, "buckets": {column: kept categories}}
+    """
+    dropped, buckets = {}, {}
+    categorical = X.select_dtypes(include=["object", "string", "category"]).columns
+    for col in X.columns:
+        series = X[col]
+        n_unique = series.nunique()
+        if series.nunique(dropna=False) <= 1:
+            dropped[col] = "constant"
+        elif pd.api.types.is_integer_dtype(series.dtype) and n_unique == len(series) and \
+                series.is_monotonic_increasing:
+            dropped[col] = "ID-like"
+        elif col in categorical and n_unique > unique_ratio * len(series):
+            counts = series.value_counts()
+            kept = counts.index[counts >= min_category_rows]
+            if len(kept):
+                buckets[col] = np.array(sorted(kept), dtype=object)
+            else:
+                dropped[col] = f"near-unique ({n_unique} values in {len(series)} rows)"
+
+    if correlation is not None:
+        numeric = [c for c in correlation.columns if c in X.columns and c not in categorical and c not in dropped]
+        target = correlation[y.name].abs() if y.name in correlation.columns else None
+        corr = correlation.loc[numeric, numeric].abs()
+        for i, first in enumerate(numeric):
+            for second in numeric[i + 1:]:
+                if first in dropped:
+                    break
+                if second in dropped or not corr.loc[first, second] > max_correlation:
+                    continue
+                keep_first = target is None or not target[second] > target[first]
+                loser, winner = (second, first) if keep_first else (first, second)
+                dropped[loser] = f"correlated {corr.loc[first, second]:.2f} with {winner}"
+
+    if len(dropped) == X.shape[1]:
+        # Small files can make every column look near-unique; training needs at least one feature
+        print(f"Screening skipped: it would have dropped all {X.shape[1]} feature columns")
+        return X, {"dropped": {}, "buckets": {}}
+    X = _apply_buckets(X.drop(columns=list(dropped)), buckets)
+    return X, {"dropped": dropped, "buckets": buckets}
+
+
+def _select_features(encoded, y, max_features):
+    """
+    Ranks encoded features by a univariate F-test against y (ANOVA F for
+    classes, correlation F for a numeric target).
+    Returns: sorted indices of the max_features best columns, or None if there are no more than that
+    """
+    if not max_features or encoded.shape[1] <= max_features:
+        return None
+    score_func = f_classif if y.dtype == "object" else f_regression
+    # Constant columns have no F score; they rank last
+    with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore")
+        scores, _ = score_func(encoded, y)
+    scores = np.nan_to_num(scores, nan=0.0)
+    return np.sort(np.argsort(scores, kind="stable")[::-1][:max_features])
+
+
+def _memory_mb(df):
+    return df.memory_usage(index=False, deep=True).sum() / 1024 ** 2
+
+
+def preprocess_data(data, return_pipeline=False, dataset_name=None, encoding=ENCODING, output_base="eda_charts",
+                    compact=COMPACT_DTYPES, screen=SCREENING, max_features=SCREEN_MAX_FEATURES, n_jobs=EDA_WORKERS):
+    """
+    Reads, cleans, encodes and scales a dataset; the last column is the target.
+    data is a file path or an already loaded DataFrame (which is not modified).
+    dataset_name names the EDA chart folder under output_base; it defaults to the file name.
+    With return_pipeline=True also returns the fitted PreprocessingPipeline
+    so the same transformation can be applied to new raw rows.
+    encoding is "dense" (one-hot via pd.get_dummies), "sparse" (per-column
+    one-hot, hashing or ordinal codes in a scipy.sparse matrix, see
+    SparsePreprocessingPipeline) or "auto", which picks sparse when one-hot
+    encoding would add SPARSE_MIN_DUMMIES columns or more.
+    With compact, columns are downcast on ingest (see compact_dtypes) and the
+    features are float32; intermediate frames are released as soon as the
+    next stage no longer needs them.
+    With screen, constant, ID-like, near-unique and collinear columns are
+    removed before encoding (see screen_features); with max_features only
+    that many encoded features are kept, ranked by a univariate F-test.
+    The pipeline repeats the bucketing and selection on new rows.
+    n_jobs is the number of processes the EDA charts are rendered in.
+    Returns: X_scaled, y (, pipeline)
+    """
+    print("\nStarting data preprocessing...\n")
+
+    if isinstance(data, pd.DataFrame):
+        df = data.copy(deep=False)
+        dataset_name = dataset_name or "dataset"
+    else:
+        # Format, delimiter and header are sniffed; parsed frames are cached by content hash
+        file_path = data
+        try:
+            df = read_dataset(file_path)
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+            return (None, None, None) if return_pipeline else (None, None)
+        dataset_name = dataset_name or os.path.splitext(os.path.basename(file_path))[0]
 
     print("Columns detected:", df.columns.tolist())
+    dtype = np.float32 if compact else np.float64
+
+    if compact:
+        with span("compact_dtypes", input_shape=shape_of(df)) as attrs:
+            before_mb = _memory_mb(df)
+            df = compact_dtypes(df, exclude=[df.columns[-1]])
+            attrs["mb_before"], attrs["mb_after"] = round(before_mb, 1), round(_memory_mb(df), 1)
+        print(f"Compact dtypes: {attrs['mb_before']:.1f} MB -> {attrs['mb_after']:.1f} MB")
 
     # Drop rows with missing values
-    df = df.dropna()
+    with span("dropna", input_shape=shape_of(df)) as attrs:
+        df = df.dropna()
+        # Categories only seen in dropped rows would otherwise become all-zero columns
+        for col in df.select_dtypes(include=["category"]).columns:
+            df[col] = df[col].cat.remove_unused_categories()
+        attrs["output_shape"] = shape_of(df)
 
-    dataset_name = os.path.splitext(os.path.basename(file_path))[0]
-    perform_pre_training_eda(df, dataset_name)
+    with span("eda", input_shape=shape_of(df)):
+        _, correlation = perform_pre_training_eda(df, dataset_name, n_jobs=n_jobs, output_base=output_base)
 
     # Assume last column is target
     X = df.iloc[:, :-1]
-    y = df.iloc[:, -1]
+    y = df.iloc[:, -1].copy()
+    target_column = df.columns[-1]
+    del df
+
+    buckets = {}
+    if screen:
+        with span("screen_features", input_shape=shape_of(X)) as attrs:
+            X, screening = screen_features(X, y, correlation)
+            buckets = screening["buckets"]
+            attrs["output_shape"] = shape_of(X)
+        for col, reason in screening["dropped"].items():
+            print(f"Screening: dropped {col} ({reason})")
+        for col, kept in buckets.items():
+            print(f"Screening: {col} reduced to its {len(kept)} most common categories plus one bucket")
+
+    categorical = X.select_dtypes(include=["object", "string", "category"]).columns
+    if encoding == "auto":
+        n_dummies = sum(X[col].nunique() for col in categorical)
+        encoding = "sparse" if n_dummies >= SPARSE_MIN_DUMMIES else "dense"
+
+    if encoding == "sparse":
+        with span("encode", encoding="sparse", input_shape=shape_of(X)) as attrs:
+            pipeline = SparsePreprocessingPipeline.fit(X, target_column=target_column, dtype=dtype, y=y,
+                                                       max_features=max_features)
+            pipeline.buckets = buckets
+            X_scaled = pipeline.transform(X)
+            attrs["output_shape"] = shape_of(X_scaled)
+        dense_mb = X_scaled.shape[0] * X_scaled.shape[1] * X_scaled.dtype.itemsize / 1024 ** 2
+        sparse_mb = (X_scaled.data.nbytes + X_scaled.indices.nbytes + X_scaled.indptr.nbytes) / 1024 ** 2
+        print(f"Sparse encoding: {X_scaled.shape[1]} features, {sparse_mb:.1f} MB ({dense_mb:.1f} MB dense)")
+        print("\nData preprocessing complete")
+        return (X_scaled, y, pipeline) if return_pipeline else (X_scaled, y)
+
+    # Encode categorical features straight into one matrix of the output dtype
+    # (same layout as pd.get_dummies, without its intermediate frame)
+    with span("encode", encoding="dense", input_shape=shape_of(X)) as attrs:
+        pipeline = PreprocessingPipeline.from_frame(X, StandardScaler(), target_column=target_column, dtype=dtype)
+        pipeline.buckets = buckets
+        X_scaled = _encode_chunk(X, pipeline.numeric_columns, pipeline.vocab, dtype=dtype)
+        attrs["output_shape"] = shape_of(X_scaled)
+    del X
+
+    if max_features:
+        with span("select_features", input_shape=shape_of(X_scaled)) as attrs:
+            pipeline.selected = _select_features(X_scaled, y, max_features)
+            if pipeline.selected is not None:
+                X_scaled = X_scaled[:, pipeline.selected]
+            attrs["output_shape"] = shape_of(X_scaled)
+        print(f"Feature budget: kept {X_scaled.shape[1]} of {len(pipeline.vocab_columns)} encoded features")
+
+    # Scale numeric features in place; the statistics are gathered in row blocks
+    # because the scaler accumulates in float64, which would copy a float32 matrix whole
+    with span("scale", input_shape=shape_of(X_scaled)):
+        for start in range(0, len(X_scaled), PREPROCESS_CHUNK_SIZE):
+            pipeline.scaler.partial_fit(X_scaled[start:start + PREPROCESS_CHUNK_SIZE])
+        X_scaled = pipeline.scaler.transform(X_scaled, copy=False)
+
+    print("\nData preprocessing complete")
+    if return_pipeline:
+        return X_scaled, y, pipeline
+    return X_scaled, y
+
+
+class PreprocessingPipeline:
+    """
+    Fitted preprocessing state needed to score new raw rows: the input column
+    order, the category vocabularies behind the one-hot layout, the scaler and
+    the dtype of the feature matrix. buckets (column -> kept categories) and
+    selected (indices of the encoded columns kept) repeat feature screening.
+    """
+    # Pipelines saved before compact dtypes and feature screening existed
+    dtype = np.float64
+    buckets = None
+    selected = None
 
-    # Encode categorical features
-    X = pd.get_dummies(X)
+    def __init__(self, numeric_columns, vocab, scaler, target_column=None, dtype=np.float64):
+        self.numeric_columns = list(numeric_columns)
+        self.vocab = dict(vocab)
+        self.scaler = scaler
+        self.target_column = target_column
+        self.dtype = dtype
+
+    @classmethod
+    def from_frame(cls, X, scaler, target_column=None, dtype=np.float64):
+        """
+        Builds the pipeline for a cleaned feature frame, encoding the same
+        columns pd.get_dummies does.
+        """
+        categorical = X.select_dtypes(include=["object", "string", "category"]).columns
+        numeric_columns = [c for c in X.columns if c not in categorical]
+        vocab = {col: np.array(sorted(X[col].unique()), dtype=object) for col in categorical}
+        return cls(numeric_columns, vocab, scaler, target_column, dtype)
+
+    @property
+    def input_columns(self):
+        return self.numeric_columns + list(self.vocab)
+
+    @property
+    def vocab_columns(self):
+        columns = list(self.numeric_columns)
+        for col, categories in self.vocab.items():
+            columns.extend(f"{col}_{category}" for category in categories)
+        return columns
+
+    @property
+    def feature_columns(self):
+        columns = self.vocab_columns
+        return columns if self.selected is None else [columns[i] for i in self.selected]
+
+    def bucket(self, df):
+        """
+        Moves categories outside a screened column's kept set into its shared bucket.
+        """
+        return _apply_buckets(df, self.buckets)
+
+    def transform(self, df):
+        """
+        Encodes and scales raw rows into the model's feature matrix.
+        Missing numeric values are imputed with the training mean; missing
+        or unseen categories encode as all zeros.
+        """
+        missing = [c for c in self.input_columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Input is missing columns: {missing}")
+        X = _encode_chunk(self.bucket(df), self.numeric_columns, self.vocab, dtype=self.dtype)
+        if self.selected is not None:
+            X = X[:, self.selected]
+        X -= self.scaler.mean_
+        X /= self.scaler.scale_
+        np.nan_to_num(X, copy=False, nan=0.0)
+        return X
+
+
+class SparsePreprocessingPipeline:
+    """
+    Preprocessing for wide categorical data that keeps the feature matrix sparse.
+    Each categorical column is encoded by its cardinality: two categories as one
+    ordinal column, up to ONEHOT_MAX_CARDINALITY as sparse one-hot columns, and
+    more than that hashed into HASH_WIDTH columns. Features are scaled to unit
+    variance without centering, which would make the matrix dense.
+    Same interface as PreprocessingPipeline.
+    """
+    dtype = np.float64
+    buckets = None
+    selected = None
+
+    def __init__(self, numeric_columns, numeric_means, encodings, scaler, target_column=None, dtype=np.float64):
+        self.numeric_columns = list(numeric_columns)
+        self.numeric_means = np.asarray(numeric_means, dtype=np.float64)
+        self.encodings = dict(encodings)
+        self.scaler = scaler
+        self.target_column = target_column
+        self.dtype = dtype
+
+    @classmethod
+    def fit(cls, X, target_column=None, dtype=np.float64, y=None, max_features=None):
+        """
+        Chooses each categorical column's encoding and fits the scaler on a cleaned feature frame.
+        With max_features, only that many encoded columns are kept, ranked against y.
+        """
+        categorical = X.select_dtypes(include=["object", "string", "category"]).columns
+        numeric_columns = [c for c in X.columns if c not in categorical]
+        encodings = {}
+        for col in categorical:
+            categories = np.array(sorted(X[col].unique()), dtype=object)
+            if len(categories) <= 2:
+                encodings[col] = ("ordinal", categories)
+            elif len(categories) <= ONEHOT_MAX_CARDINALITY:
+                encodings[col] = ("onehot", categories)
+            else:
+                encodings[col] = ("hash", HASH_WIDTH)
+
+        pipeline = cls(numeric_columns, X[numeric_columns].mean().to_numpy(), encodings,
+                       StandardScaler(with_mean=False), target_column, dtype)
+        encoded = pipeline.encode(X)
+        if max_features:
+            pipeline.selected = _select_features(encoded, y, max_features)
+            if pipeline.selected is not None:
+                encoded = encoded[:, pipeline.selected]
+        pipeline.scaler.fit(encoded)
+        return pipeline
+
+    @property
+    def input_columns(self):
+        return self.numeric_columns + list(self.encodings)
+
+    @property
+    def vocab_columns(self):
+        columns = list(self.numeric_columns)
+        for col, (kind, arg) in self.encodings.items():
+            if kind == "ordinal":
+                columns.append(col)
+            elif kind == "onehot":
+                columns.extend(f"{col}_{category}" for category in arg)
+            else:
+                columns.extend(f"{col}_hash_{i}" for i in range(arg))
+        return columns
+
+    @property
+    def feature_columns(self):
+        columns = self.vocab_columns
+        return columns if self.selected is None else [columns[i] for i in self.selected]
+
+    def bucket(self, df):
+        return _apply_buckets(df, self.buckets)
+
+    def encode(self, df):
+        """
+        Encodes raw rows without scaling or feature selection. Returns: scipy.sparse CSR matrix
+        """
+        df = self.bucket(df)
+        n = len(df)
+        numeric = df[self.numeric_columns].to_numpy(dtype=self.dtype)
+        # Missing numeric values are imputed with the training mean
+        missing = np.isnan(numeric)
+        numeric[missing] = np.take(self.numeric_means, np.nonzero(missing)[1])
+        blocks = [sparse.csr_matrix(numeric)]
+
+        for col, (kind, arg) in self.encodings.items():
+            if kind == "hash":
+                hasher = FeatureHasher(n_features=arg, input_type="string", alternate_sign=False, dtype=self.dtype)
+                blocks.append(hasher.transform([[str(v)] if pd.notna(v) else [] for v in category_values(df[col])]))
+                continue
+            codes = pd.Categorical(category_values(df[col]), categories=arg).codes
+            known = np.flatnonzero(codes >= 0)
+            if kind == "ordinal":
+                # 1-based so missing or unseen categories (0) stay implicit zeros
+                values, cols, width = codes[known] + 1.0, np.zeros(len(known), dtype=np.int64), 1
+            else:
+                values, cols, width = np.ones(len(known)), codes[known], len(arg)
+            blocks.append(sparse.csr_matrix((values, (known, cols)), shape=(n, width), dtype=self.dtype))
+
+        return sparse.hstack(blocks, format="csr", dtype=self.dtype)
+
+    def transform(self, df):
+        """
+        Encodes and scales raw rows into the model's sparse feature matrix.
+        Unseen categories encode as all zeros.
+        """
+        missing = [c for c in self.input_columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Input is missing columns: {missing}")
+        encoded = self.encode(df)
+        if self.selected is not None:
+            encoded = encoded[:, self.selected]
+        return self.scaler.transform(encoded)
+
+
+def _encode_chunk(X, numeric_cols, vocab, dtype=np.float64):
+    """
+    One-hot encodes a chunk against fixed category vocabularies into one dtype matrix.
+    The blocks are written into a preallocated matrix, so no per-block copies are kept.
+    Column order matches pd.get_dummies: numeric columns first, then one
+    column per (categorical column, sorted category). Unseen categories encode as all zeros.
+    """
+    n = len(X)
+    width = len(numeric_cols) + sum(len(categories) for categories in vocab.values())
+    encoded = np.zeros((n, width), dtype=dtype)
+    if numeric_cols:
+        encoded[:, :len(numeric_cols)] = X[numeric_cols].to_numpy(dtype=dtype)
+    offset = len(numeric_cols)
+    for col, categories in vocab.items():
+        codes = pd.Categorical(category_values(X[col]), categories=categories).codes
+        known = codes >= 0
+        encoded[np.flatnonzero(known), offset + codes[known]] = 1.0
+        offset += len(categories)
+    return encoded
+
+
+def _read_schema(file_path, chunksize, target_column=None):
+    """
+    Reads the first chunk to fix the column names and dtypes used for every chunk.
+    The target is target_column if given, otherwise the last column.
+    """
+    head = read_head(file_path, chunksize)
+
+    # Numeric columns are read as float64 so a missing value in a later chunk
+    # doesn't break the cast; this is the dtype pandas infers for the whole file anyway.
+    dtypes = {}
+    for col, dtype in head.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            dtypes[col] = "boolean"
+        elif pd.api.types.is_numeric_dtype(dtype):
+            dtypes[col] = np.float64
+        else:
+            dtypes[col] = object
+
+    names = head.columns.tolist()
+    target_column = target_column or names[-1]
+    columns = [c for c in names if c != target_column] + [target_column]
+
+    return {
+        "dtypes": dtypes,
+        "names": names,
+        "columns": columns,
+        "kinds": dtypes,
+        "target_is_int": pd.api.types.is_integer_dtype(head[target_column].dtype),
+        "head": head[columns],
+    }
+
+
+def _iter_raw_chunks(file_path, schema, chunksize):
+    try:
+        for chunk in iter_chunks(file_path, chunksize, dtype=schema["dtypes"]):
+            yield chunk[schema["columns"]]
+    except ValueError as e:
+        raise ValueError(
+            f"Column types in {file_path} change after the first {chunksize} rows; "
+            f"use preprocess_data or a larger chunksize ({e})"
+        )
+
+
+def fit_streaming_preprocessor(file_path, chunksize=PREPROCESS_CHUNK_SIZE, target_column=None,
+                               compact=COMPACT_DTYPES):
+    """
+    First pass over the file: learns the category vocabularies, the scaler
+    statistics and the target column without holding more than one chunk in memory.
+    With compact the pipeline produces float32 features.
+    """
+    schema = _read_schema(file_path, chunksize, target_column)
+    feature_cols = schema["columns"][:-1]
+    numeric_cols = [c for c in feature_cols if schema["kinds"][c] is not object]
+    categorical_cols = [c for c in feature_cols if schema["kinds"][c] is object]
+
+    numeric_scaler = StandardScaler()
+    category_counts = {col: pd.Series(dtype=np.int64) for col in categorical_cols}
+    y_parts = []
+    target_has_nan = False
+    n_rows = 0
+
+    for chunk in _iter_raw_chunks(file_path, schema, chunksize):
+        target_has_nan = target_has_nan or chunk.iloc[:, -1].isna().any()
+        chunk = chunk.dropna()
+        if chunk.empty:
+            continue
+        if numeric_cols:
+            numeric_scaler.partial_fit(chunk[numeric_cols].to_numpy(dtype=np.float64))
+        for col in categorical_cols:
+            category_counts[col] = category_counts[col].add(chunk[col].value_counts(), fill_value=0)
+        y_parts.append(chunk.iloc[:, -1])
+        n_rows += len(chunk)
+
+    if n_rows == 0:
+        raise ValueError(f"No complete rows in {file_path}")
+
+    # Dummy columns are 0/1, so their mean is the category frequency and their variance p * (1 - p)
+    vocab = {col: np.array(sorted(counts.index), dtype=object) for col, counts in category_counts.items()}
+    means, variances = [], []
+    if numeric_cols:
+        means.append(numeric_scaler.mean_)
+        variances.append(numeric_scaler.var_)
+    for col, categories in vocab.items():
+        p = category_counts[col].reindex(categories).to_numpy(dtype=np.float64) / n_rows
+        means.append(p)
+        variances.append(p * (1 - p))
 
-    # Scale numeric features
     scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    scaler.mean_ = np.concatenate(means) if means else np.empty(0)
+    scaler.var_ = np.concatenate(variances) if variances else np.empty(0)
+    scale = np.sqrt(scaler.var_)
+    scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+    scaler.scale_ = scale
+    scaler.n_samples_seen_ = n_rows
+    scaler.n_features_in_ = len(scaler.mean_)
+
+    y = pd.concat(y_parts)
+    if schema["target_is_int"] and not target_has_nan:
+        y = y.astype(np.int64)
+
+    schema.update({
+        "pipeline": PreprocessingPipeline(numeric_cols, vocab, scaler, target_column=schema["columns"][-1],
+                                          dtype=np.float32 if compact else np.float64),
+        "n_rows": n_rows,
+        "y": y,
+    })
+    return schema
+
+
+def iter_preprocessed_chunks(file_path, chunksize=PREPROCESS_CHUNK_SIZE, schema=None):
+    """
+    Second pass over the file: yields (X_chunk, y_chunk) encoded and scaled
+    with the statistics learned by fit_streaming_preprocessor.
+    """
+    if schema is None:
+        schema = fit_streaming_preprocessor(file_path, chunksize)
+    pipeline = schema["pipeline"]
+    for chunk in _iter_raw_chunks(file_path, schema, chunksize):
+        chunk = chunk.dropna()
+        if chunk.empty:
+            continue
+        yield pipeline.transform(chunk), chunk.iloc[:, -1]
+
+
+def preprocess_data_chunked(file_path, chunksize=PREPROCESS_CHUNK_SIZE, output_path=None, return_pipeline=False,
+                            target_column=None, dataset_name=None, eda=True, output_base="eda_charts",
+                            compact=COMPACT_DTYPES, n_jobs=EDA_WORKERS):
+    """
+    Out-of-core version of preprocess_data for files larger than memory.
+    Makes two passes over the file in chunks and produces the same matrix as
+    preprocess_data (up to floating-point rounding). With output_path the matrix
+    is written to a memory-mapped .npy file instead of being held in memory.
+    Pre-training EDA is drawn from the first chunk only.
+    target_column defaults to the last column; dataset_name to the file name.
+    eda=False skips the EDA, e.g. when it was already drawn from a sample;
+    n_jobs is the number of processes it is rendered in.
+    With compact the matrix is float32, halving the memory map.
+    Returns: X, y (, pipeline)
+    """
+    print("\nStarting chunked data preprocessing...\n")
+
+    try:
+        with span("fit_streaming", chunksize=chunksize) as attrs:
+            schema = fit_streaming_preprocessor(file_path, chunksize, target_column, compact)
+            attrs["rows"] = schema["n_rows"]
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return (None, None, None) if return_pipeline else (None, None)
+
+    print("Columns detected:", schema["columns"])
+
+    if eda:
+        dataset_name = dataset_name or os.path.splitext(os.path.basename(file_path))[0]
+        with span("eda", input_shape=shape_of(schema["head"])):
+            perform_pre_training_eda(schema["head"].dropna(), dataset_name, n_jobs=n_jobs, output_base=output_base)
+
+    n_features = len(schema["pipeline"].feature_columns)
+    dtype = schema["pipeline"].dtype
+    if output_path:
+        X = np.lib.format.open_memmap(output_path, mode="w+", dtype=dtype, shape=(schema["n_rows"], n_features))
+    else:
+        X = np.empty((schema["n_rows"], n_features), dtype=dtype)
+
+    with span("encode", encoding="chunked", output_shape=shape_of(X)):
+        row = 0
+        for X_chunk, _ in iter_preprocessed_chunks(file_path, chunksize, schema):
+            X[row:row + len(X_chunk)] = X_chunk
+            row += len(X_chunk)
+        if output_path:
+            X.flush()
 
     print("\nData preprocessing complete")
-    return X_scaled, y
\ No newline at end of file
+    if return_pipeline:
+        return X, schema["y"], schema["pipeline"]
+    return X, schema["y"]
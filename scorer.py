@@ -0,0 +1,95 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from config import PREPROCESS_CHUNK_SIZE
+from ingestion import iter_chunks
+from model_registry import load_artifact
+
+# Artifact loaded once per scoring worker process
+_worker_artifact = None
+
+
+def _init_worker(model_path):
+    global _worker_artifact
+    _worker_artifact = load_artifact(model_path)
+
+
+def _score_chunk(chunk):
+    return predict_frame(_worker_artifact, chunk)
+
+
+def predict_frame(artifact, df):
+    """
+    Runs raw rows through a saved artifact's preprocessing pipeline and model.
+    """
+    if artifact["pipeline"] is None:
+        raise ValueError("Artifact has no preprocessing pipeline; re-train the model to score raw rows")
+    X = artifact["pipeline"].transform(df)
+    return artifact["model"].predict(X)
+
+
+def _read_chunks(input_path, chunksize):
+    # Sniffed the same way as the training file, so headerless files get the same column names
+    return iter_chunks(input_path, chunksize)
+
+
+def score_csv(model_path, input_path, output_path, chunksize=PREPROCESS_CHUNK_SIZE, n_jobs=1):
+    """
+    Streams a raw CSV through a saved model artifact in chunks and writes one
+    prediction per input row to output_path. With n_jobs > 1 chunks are
+    scored in parallel worker processes; output order always matches the input.
+    Returns: number of rows scored, rows per second
+    """
+    print(f"\nScoring {input_path} with {model_path}...\n")
+    start = time.perf_counter()
+    n_rows = 0
+    first = True
+
+    def write(chunk, predictions):
+        nonlocal first, n_rows
+        pd.DataFrame({"prediction": predictions}, index=chunk.index).to_csv(
+            output_path, mode="w" if first else "a", header=first, index_label="row"
+        )
+        first = False
+        n_rows += len(chunk)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    if n_jobs == 1:
+        artifact = load_artifact(model_path)
+        for chunk in _read_chunks(input_path, chunksize):
+            write(chunk, predict_frame(artifact, chunk))
+    else:
+        # Keep a bounded number of chunks in flight so memory stays flat
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(model_path,)) as executor:
+            pending = deque()
+            for chunk in _read_chunks(input_path, chunksize):
+                pending.append((chunk, executor.submit(_score_chunk, chunk)))
+                if len(pending) >= 2 * n_jobs:
+                    done_chunk, future = pending.popleft()
+                    write(done_chunk, future.result())
+            while pending:
+                done_chunk, future = pending.popleft()
+                write(done_chunk, future.result())
+
+    elapsed = time.perf_counter() - start
+    rows_per_second = n_rows / elapsed if elapsed > 0 else float("inf")
+    print(f"Scored {n_rows} rows in {elapsed:.2f}s ({rows_per_second:,.0f} rows/s)")
+    print(f"Predictions saved to {output_path}")
+    return n_rows, rows_per_second
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a raw CSV with a saved model artifact.")
+    parser.add_argument("model_path", help="Path to a .pkl artifact under models/")
+    parser.add_argument("input_path", help="Raw CSV with the same columns the model was trained on")
+    parser.add_argument("output_path", help="Where to write the predictions CSV")
+    parser.add_argument("--chunksize", type=int, default=PREPROCESS_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Number of scoring processes")
+    args = parser.parse_args()
+    score_csv(args.model_path, args.input_path, args.output_path, args.chunksize, args.workers)
@@ -0,0 +1,283 @@
+import io
+import os
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+from config import SERVE_HOST, SERVE_PORT, SERVE_MAX_BATCH_ROWS, SERVE_MAX_WAIT_MS
+from model_registry import list_models, load_artifact
+from scorer import predict_frame
+
+# Latencies kept for the percentiles reported by /metrics
+LATENCY_WINDOW = 10_000
+
+
+class Metrics:
+    """
+    Request, row and batch counters plus a window of recent request latencies.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.batches = 0
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def record_request(self, n_rows, latency_ms, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.rows += n_rows
+            self.latencies_ms.append(latency_ms)
+
+    def record_batch(self):
+        with self.lock:
+            self.batches += 1
+
+    def snapshot(self):
+        with self.lock:
+            uptime = time.perf_counter() - self.started
+            latencies = np.array(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+            return {
+                "uptime_s": round(uptime, 1),
+                "requests": self.requests,
+                "errors": self.errors,
+                "rows": self.rows,
+                "batches": self.batches,
+                "mean_batch_rows": round(self.rows / self.batches, 2) if self.batches else 0.0,
+                "requests_per_s": round(self.requests / uptime, 2),
+                "rows_per_s": round(self.rows / uptime, 2),
+                "latency_ms": {
+                    "p50": round(float(np.percentile(latencies, 50)), 3),
+                    "p95": round(float(np.percentile(latencies, 95)), 3),
+                    "p99": round(float(np.percentile(latencies, 99)), 3),
+                    "max": round(float(latencies.max()), 3),
+                },
+            }
+
+
+class _Pending:
+    def __init__(self, frame):
+        self.frame = frame
+        self.done = threading.Event()
+        self.predictions = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Serves one model: request threads enqueue their rows and wait, while a
+    single batching thread drains the queue into one vectorised predict call
+    per batch. A batch closes once it holds max_batch_rows rows or max_wait_ms
+    has passed since its first request, whichever comes first.
+    """
+
+    def __init__(self, artifact, metrics, max_batch_rows=SERVE_MAX_BATCH_ROWS, max_wait_ms=SERVE_MAX_WAIT_MS):
+        self.artifact = artifact
+        self.metrics = metrics
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def predict(self, frame):
+        pending = _Pending(frame)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.predictions
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            n_rows = len(batch[0].frame)
+            deadline = time.perf_counter() + self.max_wait
+            while n_rows < self.max_batch_rows:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                n_rows += len(pending.frame)
+            try:
+                self._predict_batch(batch)
+            except Exception as e:
+                # Whatever went wrong, no request may be left waiting on a batch that won't finish
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+
+    def _predict_batch(self, batch):
+        try:
+            frame = pd.concat([pending.frame for pending in batch], ignore_index=True)
+            predictions = predict_frame(self.artifact, frame)
+        except Exception as e:
+            # One bad request mustn't fail the others batched with it
+            if len(batch) > 1:
+                for pending in batch:
+                    self._predict_batch([pending])
+                return
+            batch[0].error = e
+            batch[0].done.set()
+            return
+        self.metrics.record_batch()
+        start = 0
+        for pending in batch:
+            pending.predictions = predictions[start:start + len(pending.frame)]
+            start += len(pending.frame)
+            pending.done.set()
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 resets connections under concurrent clients
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def load_models(model_names=None, max_batch_rows=SERVE_MAX_BATCH_ROWS, max_wait_ms=SERVE_MAX_WAIT_MS,
+                metrics=None):
+    """
+    Loads registered artifacts once and starts a batcher for each, recording into
+    metrics (a new Metrics if not given).
+    Models are named by their file name without extension, e.g. titanic_survival_random_forest_classifier.
+    Returns: dict of model name -> MicroBatcher
+    """
+    metrics = metrics or Metrics()
+    batchers = {}
+    for entry in list_models():
+        name = os.path.splitext(os.path.basename(entry["file_path"]))[0]
+        if name in batchers or (model_names and name not in model_names):
+            continue
+        artifact = load_artifact(entry["file_path"])
+        if artifact["pipeline"] is None:
+            print(f"Skipping {name}: saved without a preprocessing pipeline")
+            continue
+        # Batches are small, so joblib's worker start-up would cost more than the predict itself
+        if "n_jobs" in artifact["model"].get_params():
+            artifact["model"].set_params(n_jobs=1)
+        batchers[name] = MicroBatcher(artifact, metrics, max_batch_rows, max_wait_ms)
+        print(f"Loaded {name}")
+    return batchers
+
+
+def parse_rows(body, content_type):
+    """
+    Reads request rows from JSON (a row object, a list of them, or {"rows": [...]}) or CSV with a header.
+    Returns: DataFrame
+    """
+    if "csv" in content_type:
+        return pd.read_csv(io.BytesIO(body))
+    payload = json.loads(body or b"null")
+    if isinstance(payload, dict):
+        payload = payload.get("rows", [payload])
+    if not isinstance(payload, list) or not payload:
+        raise ValueError('Expected a row object, a list of rows or {"rows": [...]}')
+    return pd.DataFrame(payload)
+
+
+def make_handler(batchers, metrics):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        # Keep-alive so clients can reuse a connection between requests
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out as separate writes; with Nagle's algorithm
+            # the body waits for the client's delayed ACK (~40 ms) on every response
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, metrics.snapshot())
+            elif self.path == "/models":
+                self._send(200, {
+                    name: {"input_columns": batcher.artifact["pipeline"].input_columns,
+                           "dataset_name": batcher.artifact.get("dataset_name"),
+                           "score": batcher.artifact.get("score")}
+                    for name, batcher in batchers.items()
+                })
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            start = time.perf_counter()
+            name = self.path.rstrip("/").rsplit("/", 1)[-1]
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self.path.startswith("/predict/") or name not in batchers:
+                self._send(404, {"error": f"Unknown model {name}; see GET /models"})
+                return
+
+            # Only rows that were predicted count towards rows and rows_per_s
+            try:
+                frame = parse_rows(body, self.headers.get("Content-Type", ""))
+                predictions = batchers[name].predict(frame)
+            except (ValueError, KeyError) as e:
+                metrics.record_request(0, (time.perf_counter() - start) * 1000, error=True)
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                metrics.record_request(0, (time.perf_counter() - start) * 1000, error=True)
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            metrics.record_request(len(frame), (time.perf_counter() - start) * 1000)
+            self._send(200, {"model": name, "predictions": np.asarray(predictions).tolist()})
+
+        def log_message(self, format, *args):
+            pass  # per-request logging would dominate latency; see /metrics
+
+    return PredictionHandler
+
+
+def serve(host=SERVE_HOST, port=SERVE_PORT, model_names=None, max_batch_rows=SERVE_MAX_BATCH_ROWS,
+          max_wait_ms=SERVE_MAX_WAIT_MS):
+    """
+    Serves registered models over HTTP until interrupted:
+      POST /predict/<model>  JSON or CSV rows -> {"predictions": [...]}
+      GET  /models           loaded models and their input columns
+      GET  /metrics          request/row/batch counters, throughput and latency percentiles
+    """
+    metrics = Metrics()
+    batchers = load_models(model_names, max_batch_rows, max_wait_ms, metrics)
+    server = PredictionServer((host, port), make_handler(batchers, metrics))
+    print(f"Serving {len(batchers)} models on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve registered models over HTTP with micro-batching.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--model", nargs="*", help="Only load these models (file names without extension)")
+    parser.add_argument("--max-batch-rows", type=int, default=SERVE_MAX_BATCH_ROWS)
+    parser.add_argument("--max-wait-ms", type=float, default=SERVE_MAX_WAIT_MS)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.model, args.max_batch_rows, args.max_wait_ms)
@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+import joblib
+
+from config import (STAGE_CACHE_MAX_MB, ENCODING, SPARSE_MIN_DUMMIES, ONEHOT_MAX_CARDINALITY, HASH_WIDTH,
+                    COMPACT_DTYPES, COMPACT_CATEGORY_RATIO, SCREENING, SCREEN_UNIQUE_RATIO,
+                    SCREEN_MIN_CATEGORY_ROWS, SCREEN_MAX_CORRELATION, SCREEN_MAX_FEATURES,
+                    TRAINING_TIME_BUDGET, SEARCH_TIME_BUDGET, SEARCH_CANDIDATES, SEARCH_FACTOR,
+                    RACING, RACING_FRACTIONS, RACING_ALPHA, RACING_MIN_ROWS, HGB_MAX_ITER, HGB_MAX_BINS)
+from ingestion import file_hash, PARSER_VERSION
+from evaluator import write_report
+from tracing import span
+from workspace import atomic_path, link_tree
+
+STAGE_CACHE_DIR = os.path.join("data", ".stage_cache")
+
+# Bump when a stage's output format or behaviour changes, so old entries stop matching
+CACHE_VERSION = 1
+
+
+def stage_key(stage, *inputs):
+    """
+    Hashes a stage name with the keys/config values it depends on.
+    inputs must be JSON-serialisable (upstream keys, content hashes, settings).
+    """
+    payload = json.dumps([CACHE_VERSION, stage, *inputs], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _entry_path(stage, key, cache_dir):
+    return os.path.join(cache_dir, f"{stage}_{key}.joblib")
+
+
+def load(stage, key, outputs=(), cache_dir=STAGE_CACHE_DIR):
+    """
+    Returns the cached value of a stage, or None on a miss.
+    outputs lists files/folders the stage writes besides its value (charts,
+    reports); if any is gone, the entry counts as a miss so they get redrawn.
+    """
+    path = _entry_path(stage, key, cache_dir)
+    if not os.path.exists(path) or not all(os.path.exists(output) for output in outputs):
+        return None
+    try:
+        value = joblib.load(path)
+    except Exception as e:
+        print(f"Ignoring unreadable stage cache entry {path}: {e}")
+        return None
+    # The modification time doubles as the last-used time for LRU eviction
+    os.utime(path)
+    print(f"Stage cache hit: {stage}")
+    return value
+
+
+def store(stage, key, value, cache_dir=STAGE_CACHE_DIR, max_mb=STAGE_CACHE_MAX_MB):
+    """
+    Saves a stage's value (written to a temp file and renamed into place),
+    then evicts least recently used entries until the cache fits in max_mb.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _entry_path(stage, key, cache_dir)
+    with atomic_path(path) as tmp_path:
+        joblib.dump(value, tmp_path)
+    evict(cache_dir, max_mb, keep=path)
+
+
+def evict(cache_dir=STAGE_CACHE_DIR, max_mb=STAGE_CACHE_MAX_MB, keep=None):
+    """
+    Deletes the least recently used entries until the cache is at most max_mb.
+    keep (a just-written entry) is never deleted, even if it alone exceeds the cap.
+    """
+    entries = []
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(".joblib") and ".tmp" not in file_name:
+            path = os.path.join(cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # removed by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_mb * 1024 * 1024:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cached(stage, key, compute, outputs=(), save=True, cache_dir=STAGE_CACHE_DIR):
+    """
+    Returns the cached value for (stage, key), or computes and stores it.
+    save=False computes without storing (e.g. a matrix already memory-mapped on disk).
+    """
+    value = load(stage, key, outputs, cache_dir)
+    if value is None:
+        value = compute()
+        if save:
+            with span("cache_store", stage=stage):
+                store(stage, key, value, cache_dir)
+    return value
+
+
+def pipeline_keys(file_path, dataset_name, target_column=None, streamed=False):
+    """
+    Keys for the preprocess, train and evaluate stages of one dataset.
+    Each key covers the upstream key plus the settings that stage reads, so a
+    change only invalidates the stages downstream of it. The dataset goal is
+    deliberately absent: it only appears in the report.
+    """
+    preprocess = stage_key("preprocess", file_hash(file_path), PARSER_VERSION, dataset_name, target_column, streamed,
+                           ENCODING, SPARSE_MIN_DUMMIES, ONEHOT_MAX_CARDINALITY, HASH_WIDTH, COMPACT_DTYPES,
+                           COMPACT_CATEGORY_RATIO, SCREENING, SCREEN_UNIQUE_RATIO, SCREEN_MIN_CATEGORY_ROWS,
+                           SCREEN_MAX_CORRELATION, SCREEN_MAX_FEATURES)
+    train = stage_key("train", preprocess, TRAINING_TIME_BUDGET, SEARCH_TIME_BUDGET, SEARCH_CANDIDATES, SEARCH_FACTOR,
+                      RACING, RACING_FRACTIONS, RACING_ALPHA, RACING_MIN_ROWS, HGB_MAX_ITER, HGB_MAX_BINS)
+    evaluate = stage_key("evaluate", train)
+    return {"preprocess": preprocess, "train": train, "evaluate": evaluate}
+
+
+def _restore_outputs(stage, key, target, cache_dir):
+    """
+    Stage outputs live in the run that computed them. On a later run they are
+    linked into that run's folders (see workspace.link_tree) so it is complete
+    on its own; if the producing run was cleaned up the stage counts as a miss.
+    """
+    if os.path.exists(target):
+        return
+    source = load(f"{stage}_outputs", key, cache_dir=cache_dir)
+    if source and os.path.abspath(source) != os.path.abspath(target):
+        link_tree(source, target)
+
+
+def run_cached_pipeline(file_path, dataset_name, dataset_goal, preprocess, train, evaluate,
+                        target_column=None, streamed=False, cache_dir=STAGE_CACHE_DIR, output_base="eda_charts",
+                        reports_dir="reports"):
+    """
+    Runs preprocess -> train -> evaluate, reusing every stage whose inputs and
+    settings are unchanged since an earlier run.
+    preprocess() returns (X, y, pipeline), train(X, y) the trained models and
+    evaluate(trained_models) the results; each is only called on a miss, and
+    preprocessing only when a later stage needs its matrix. The callbacks are
+    expected to draw their charts under output_base (and evaluate to write its
+    report to reports_dir), which is where reused charts are linked to.
+    With streamed=True the matrix isn't cached (it's already memory-mapped on disk).
+    Returns: results, pipeline
+    """
+    keys = pipeline_keys(file_path, dataset_name, target_column, streamed)
+    safe_name = dataset_name.replace(" ", "_").lower()
+    pre_charts = os.path.join(output_base, safe_name, "pre_training")
+    post_charts = os.path.join(output_base, safe_name, "post_training")
+    upstream = {}
+
+    def checked_preprocess():
+        X, y, pipeline = preprocess()
+        if X is None:
+            raise ValueError(f"Could not preprocess {file_path}")
+        store("preprocess_outputs", keys["preprocess"], pre_charts, cache_dir)
+        return X, y, pipeline
+
+    def preprocessed():
+        if "data" not in upstream:
+            upstream["data"] = cached("preprocess", keys["preprocess"], checked_preprocess, outputs=[pre_charts],
+                                      save=not streamed, cache_dir=cache_dir)
+            X, y, pipeline = upstream["data"]
+            store("pipeline", keys["preprocess"], pipeline, cache_dir)
+        return upstream["data"]
+
+    # The fitted pipeline is kept on its own so a full hit never loads the matrix
+    _restore_outputs("preprocess", keys["preprocess"], pre_charts, cache_dir)
+    pipeline = load("pipeline", keys["preprocess"], [pre_charts], cache_dir)
+    if pipeline is None:
+        pipeline = preprocessed()[2]
+
+    _restore_outputs("evaluate", keys["evaluate"], post_charts, cache_dir)
+    results = load("evaluate", keys["evaluate"], [post_charts], cache_dir)
+    if results is None:
+        trained_models = cached("train", keys["train"], lambda: train(*preprocessed()[:2]), cache_dir=cache_dir)
+        results = evaluate(trained_models)
+        with span("cache_store", stage="evaluate"):
+            store("evaluate", keys["evaluate"], results, cache_dir)
+            store("evaluate_outputs", keys["evaluate"], post_charts, cache_dir)
+    else:
+        # Only the report mentions the goal, so it is rewritten instead of re-evaluating
+        write_report(results, dataset_name, dataset_goal, reports_dir)
+
+    return results, pipeline
@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from data_collector import fetch_url
+
+BODY = b"a,b,target\n" + b"1,2,yes\n" * 1000
+ETAG = '"v1"'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    /data.csv serves BODY with an ETag and answers 304 to a matching If-None-Match;
+    /truncated.csv promises BODY's length but breaks off after a few bytes.
+    """
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/data.csv":
+            if self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            self.wfile.write(BODY)
+        elif self.path == "/truncated.csv":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY[:10])
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_is_streamed_to_disk_and_reused_after_304(server, tmp_path):
+    file_path = str(tmp_path / "data.csv")
+
+    assert fetch_url(f"{server}/data.csv", file_path, retries=0) is True
+    with open(file_path, "rb") as f:
+        assert f.read() == BODY
+    with open(f"{file_path}.meta.json") as f:
+        meta = json.load(f)
+    assert meta == {"url": f"{server}/data.csv", "etag": ETAG, "last_modified": None, "size": len(BODY)}
+
+    # The second run revalidates the cached copy instead of downloading it again
+    assert fetch_url(f"{server}/data.csv", file_path, retries=0) is False
+    assert StandInHandler.requests_seen == [("/data.csv", None), ("/data.csv", ETAG)]
+    assert sorted(os.listdir(tmp_path)) == ["data.csv", "data.csv.meta.json"]
+
+
+def test_broken_off_body_leaves_no_partial_file(server, tmp_path):
+    file_path = str(tmp_path / "truncated.csv")
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        fetch_url(f"{server}/truncated.csv", file_path, retries=1)
+    assert len(StandInHandler.requests_seen) == 2
+    assert os.listdir(tmp_path) == []
+
+
+def test_http_error_is_raised_without_writing_anything(server, tmp_path):
+    file_path = str(tmp_path / "missing.csv")
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetch_url(f"{server}/missing.csv", file_path, retries=0)
+    assert os.listdir(tmp_path) == []
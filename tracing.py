@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import uuid
+import cProfile
+import resource
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+
+TRACE_DIR = "traces"
+
+# Tracing is switched on through the environment so it reaches worker
+# processes (run_agent's pool, the job worker) without threading a handle through every call.
+TRACE_ENV = "AUTOML_TRACE"
+PROFILE_ENV = "AUTOML_PROFILE_DIR"
+RUN_ENV = "AUTOML_TRACE_RUN"
+
+_local = threading.local()
+_write_lock = threading.Lock()
+# Peak RSS seen so far by every open span of this process, keyed by a token per span (see _track_peak)
+_open_peaks = {}
+_peak_lock = threading.Lock()
+# Fields added to every span this process records (see set_context)
+_context = {}
+
+
+def start_trace(trace_path=None, profile_dir=None, run_id=None):
+    """
+    Turns on tracing for this process and the processes it starts.
+    Spans are appended to trace_path as JSON lines; with profile_dir each
+    top-level span of a thread is also profiled and dumped as a pstats file.
+    Returns: trace_path
+    """
+    run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S_') + uuid.uuid4().hex[:6]
+    trace_path = trace_path or os.path.join(TRACE_DIR, f"{run_id}.jsonl")
+    os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+    os.environ[TRACE_ENV] = trace_path
+    os.environ[RUN_ENV] = run_id
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        os.environ[PROFILE_ENV] = profile_dir
+    return trace_path
+
+
+def stop_trace():
+    for key in (TRACE_ENV, PROFILE_ENV, RUN_ENV):
+        os.environ.pop(key, None)
+    _context.clear()
+
+
+def set_context(**fields):
+    """
+    Tags every span recorded by this process from now on, e.g. with the dataset name.
+    """
+    _context.update(fields)
+
+
+def shape_of(obj):
+    """
+    Shape of a DataFrame/array/sparse matrix as a list, or its length, or None.
+    """
+    if hasattr(obj, "shape"):
+        return list(obj.shape)
+    if hasattr(obj, "__len__"):
+        return [len(obj)]
+    return None
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def _reset_peak_rss():
+    # Linux only: writing 5 to clear_refs restarts the high-water mark at the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _track_peak(key, start=False):
+    """
+    Per-span peak RSS. The process high-water mark is folded into every open
+    span before it is reset, so each span's peak covers its own lifetime even
+    when spans nest or run on parallel threads. Where the mark can't be reset
+    this is the peak of the whole process so far.
+    Returns: the span's peak RSS in MB (when it ends)
+    """
+    with _peak_lock:
+        peak = _peak_rss_mb()
+        for open_key in _open_peaks:
+            _open_peaks[open_key] = max(_open_peaks[open_key], peak)
+        if start:
+            _open_peaks[key] = 0.0
+            _reset_peak_rss()
+            return None
+        return max(_open_peaks.pop(key, 0.0), peak)
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    Times the enclosed block as one stage of the pipeline.
+    Records wall time, process CPU time, the peak RSS reached while the block
+    ran (see _track_peak) and any attrs (e.g.
+    input_shape); the block can add more, such as the output shape, to the
+    dict it receives. Does nothing but yield attrs when tracing is off.
+    CPU time is for the whole process, so it overlaps between spans running
+    on parallel threads.
+    """
+    trace_path = os.environ.get(TRACE_ENV)
+    if not trace_path:
+        yield attrs
+        return
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+
+    profiler = None
+    profile_dir = os.environ.get(PROFILE_ENV)
+    if profile_dir and len(stack) == 1:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None  # another profiler is already running
+
+    peak_key = object()
+    _track_peak(peak_key, start=True)
+    started_at = datetime.now().isoformat(timespec="milliseconds")
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        peak_rss = _track_peak(peak_key)
+        stack.pop()
+        record = {
+            "run_id": os.environ.get(RUN_ENV),
+            **_context,
+            "name": name,
+            "parent": parent,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "started_at": started_at,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_rss_mb": round(peak_rss, 1),
+            "status": status,
+            "attrs": attrs,
+        }
+        if profiler is not None:
+            profiler.disable()
+            safe_name = "".join(c if c.isalnum() else "_" for c in name)
+            profile_path = os.path.join(profile_dir, f"{record['run_id']}_{os.getpid()}_{safe_name}.prof")
+            profiler.dump_stats(profile_path)
+            record["profile"] = profile_path
+        with _write_lock, open(trace_path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+
+def read_trace(trace_path):
+    """
+    Returns: list of span dicts in the order they finished
+    """
+    with open(trace_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans):
+    """
+    Totals wall and CPU time per stage name.
+    Returns: list of dicts (stage, calls, wall_s, cpu_s, peak_rss_mb), slowest first
+    """
+    totals = {}
+    for s in spans:
+        entry = totals.setdefault(s["name"], {"stage": s["name"], "calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                              "peak_rss_mb": 0.0})
+        entry["calls"] += 1
+        entry["wall_s"] += s["wall_s"]
+        entry["cpu_s"] += s["cpu_s"]
+        entry["peak_rss_mb"] = max(entry["peak_rss_mb"], s["peak_rss_mb"])
+    return sorted(totals.values(), key=lambda entry: entry["wall_s"], reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage timing breakdown of a trace file.")
+    parser.add_argument("trace", help="JSON-lines trace written by a traced run")
+    args = parser.parse_args()
+    print(f"{'Stage':<40} {'Calls':>6} {'Wall s':>10} {'CPU s':>10} {'Peak RSS MB':>12}")
+    for entry in summarize(read_trace(args.trace)):
+        print(f"{entry['stage']:<40} {entry['calls']:>6} {entry['wall_s']:>10.3f} {entry['cpu_s']:>10.3f} "
+              f"{entry['peak_rss_mb']:>12.1f}")
@@ -1,29 +1,461 @@
-from sklearn.model_selection import train_test_split
+import os
+import math
+import time
+import warnings
+import numpy as np
+from scipy import sparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threadpoolctl import threadpool_limits
+from scipy.stats import loguniform, ttest_rel
+from sklearn.base import clone, BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+from sklearn.model_selection import train_test_split, ParameterSampler
 from sklearn.linear_model import LogisticRegression, LinearRegression
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.ensemble import (RandomForestClassifier, RandomForestRegressor, HistGradientBoostingClassifier,
+                              HistGradientBoostingRegressor)
+from tracing import span, shape_of
+from config import (TRAINING_TIME_BUDGET, SEARCH_TIME_BUDGET, SEARCH_CANDIDATES, SEARCH_FACTOR,
+                    RACING, RACING_FRACTIONS, RACING_ALPHA, RACING_MIN_ROWS, HGB_MAX_ITER, HGB_MAX_BINS)
 
-def train_models(X, y, dataset_name):
+# Hyperparameter distributions sampled by the successive-halving search.
+# Model families without an entry are trained with their defaults.
+SEARCH_SPACES = {
+    "Logistic Regression": {
+        "C": loguniform(1e-3, 1e2),
+    },
+    "Random Forest Classifier": {
+        "n_estimators": [50, 100, 200, 400],
+        "max_depth": [None, 5, 10, 20],
+        "min_samples_leaf": [1, 2, 4, 8],
+        "max_features": ["sqrt", "log2", None],
+    },
+    "Random Forest Regressor": {
+        "n_estimators": [50, 100, 200, 400],
+        "max_depth": [None, 5, 10, 20],
+        "min_samples_leaf": [1, 2, 4, 8],
+        "max_features": [1.0, "sqrt", 0.5],
+    },
+    "Histogram Gradient Boosting Classifier": {
+        "learning_rate": loguniform(0.02, 0.5),
+        "max_leaf_nodes": [15, 31, 63, 127],
+        "min_samples_leaf": [5, 20, 50, 100],
+        "l2_regularization": [0.0, 0.1, 1.0, 10.0],
+    },
+    "Histogram Gradient Boosting Regressor": {
+        "learning_rate": loguniform(0.02, 0.5),
+        "max_leaf_nodes": [15, 31, 63, 127],
+        "min_samples_leaf": [5, 20, 50, 100],
+        "l2_regularization": [0.0, 0.1, 1.0, 10.0],
+    },
+}
+MIN_SEARCH_SAMPLES = 50
+
+# Model families trained on FeatureBinner codes instead of the preprocessed matrix
+BINNED_MODELS = ("Histogram Gradient Boosting Classifier", "Histogram Gradient Boosting Regressor")
+
+
+class FeatureBinner(BaseEstimator, TransformerMixin):
+    """
+    Maps every feature to at most max_bins quantile bins, as uint8 codes.
+    Fitted once per dataset, so every gradient-boosting fit (race rounds,
+    search trials, the final fit) reads the same binned copy of the data
+    instead of binning it again. Features with few distinct values keep one
+    bin per value. Bin edges are taken from at most subsample rows.
+    """
+
+    def __init__(self, max_bins=HGB_MAX_BINS, subsample=200_000, random_state=42):
+        self.max_bins = max_bins
+        self.subsample = subsample
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        if len(X) > self.subsample:
+            rows = np.random.RandomState(self.random_state).choice(len(X), self.subsample, replace=False)
+            X = X[np.sort(rows)]
+        quantiles = np.linspace(0, 1, self.max_bins + 1)[1:-1]
+        self.bin_edges_ = []
+        for column in np.asarray(X, dtype=np.float64).T:
+            column = column[~np.isnan(column)]
+            distinct = np.unique(column)
+            if len(distinct) <= self.max_bins:
+                edges = (distinct[:-1] + distinct[1:]) / 2
+            else:
+                edges = np.unique(np.quantile(column, quantiles))
+            self.bin_edges_.append(edges)
+        return self
+
+    def transform(self, X):
+        codes = np.empty(X.shape, dtype=np.uint8)
+        for j, edges in enumerate(self.bin_edges_):
+            codes[:, j] = np.searchsorted(edges, X[:, j], side="right")
+        return codes
+
+
+def split_train_test(X, y):
+    """
+    The train/test split train_models evaluates on; incremental.py repeats it
+    so later updates never learn from the test rows.
+    Returns: X_train, X_test, y_train, y_test
+    """
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
+
+def _is_ensemble(model):
+    params = model.get_params()
+    return "n_estimators" in params and "n_jobs" in params
+
+
+def _is_multithreaded(model):
+    # Histogram gradient boosting has no n_jobs; it runs OpenMP threads on every core
+    return _is_ensemble(model) or isinstance(model, (HistGradientBoostingClassifier, HistGradientBoostingRegressor))
+
+
+def _allocate_cores(models, n_cores):
+    """
+    Gives each cheap model one core and splits the rest between the tree
+    ensembles (via n_jobs) and histogram gradient boosting (via its OpenMP
+    threads, limited by the caller around each fit with threadpool_limits).
+    Returns: dict of model name -> cores
+    """
+    parallel = [name for name, model in models if _is_multithreaded(model)]
+    spare = max(1, n_cores - (len(models) - len(parallel)))
+    cores = {name: max(1, spare // len(parallel)) if name in parallel else 1 for name, _ in models}
+    for name, model in models:
+        if _is_ensemble(model):
+            model.set_params(n_jobs=cores[name])
+    return cores
+
+
+def _fit_with_deadline(model, X, y, deadline):
+    """
+    Fits a model. Tree ensembles are grown in stages with warm_start so the
+    fit can stop once the deadline passes; other models fit in one go.
+    Raises TimeoutError if the deadline passed before the model was complete.
+    """
+    params = model.get_params()
+    if deadline is None or "warm_start" not in params or "n_estimators" not in params:
+        model.fit(X, y)
+        return model
+
+    total = params["n_estimators"]
+    step = max(params.get("n_jobs") or 1, total // 4, 1)
+    model.set_params(warm_start=True)
+    for n_estimators in range(step, total + step, step):
+        model.set_params(n_estimators=min(n_estimators, total))
+        model.fit(X, y)
+        if n_estimators < total and time.monotonic() > deadline:
+            raise TimeoutError
+    model.set_params(warm_start=False)
+    return model
+
+
+def _timed_fit(model, X, y, deadline):
+    start = time.perf_counter()
+    _fit_with_deadline(model, X, y, deadline)
+    return time.perf_counter() - start
+
+
+def _score_config(model, params, X_fit, y_fit, X_val, y_val, deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        return None, 0.0
+    start = time.perf_counter()
+    try:
+        model = clone(model).set_params(**params)
+        # Configurations already run one per core
+        with threadpool_limits(limits=1, user_api="openmp"):
+            model.fit(X_fit, y_fit)
+        score = model.score(X_val, y_val)
+    except ValueError:
+        # e.g. a small subsample that contains a single class
+        score = -np.inf
+    return score, time.perf_counter() - start
+
+
+def successive_halving(model, param_space, X, y, n_candidates=SEARCH_CANDIDATES, factor=SEARCH_FACTOR,
+                       time_budget=SEARCH_TIME_BUDGET, n_jobs=None, random_state=42):
+    """
+    Successive-halving hyperparameter search.
+    Samples n_candidates configurations and scores them all on a small subsample
+    of (X, y) against a held-out fold. Only the best 1/factor go on to the next
+    rung, which uses factor times more rows, until one rung runs on all rows.
+    Configurations in a rung are fitted in parallel. Once time_budget seconds
+    are spent, the search stops and keeps the best result of the last complete rung.
+    Returns: best_params, history (one dict per fitted configuration)
+    """
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=0.2, random_state=random_state)
+    configs = list(ParameterSampler(param_space, n_iter=n_candidates, random_state=random_state))
+    order = np.random.RandomState(random_state).permutation(len(y_fit))
+
+    n_rungs = int(math.log(len(configs), factor)) + 1
+    n_samples = max(MIN_SEARCH_SAMPLES, len(y_fit) // factor ** (n_rungs - 1))
+    deadline = time.monotonic() + time_budget if time_budget else None
+    if "n_jobs" in model.get_params():
+        model = clone(model).set_params(n_jobs=1)
+
+    best_params, history = {}, []
+    rung = 0
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as executor:
+        while configs:
+            n_samples = min(n_samples, len(y_fit))
+            idx = order[:n_samples]
+            X_rung = X_fit[idx]
+            y_rung = y_fit.iloc[idx] if hasattr(y_fit, "iloc") else y_fit[idx]
+            outcomes = list(executor.map(
+                lambda params: _score_config(model, params, X_rung, y_rung, X_val, y_val, deadline),
+                configs,
+            ))
+            if any(score is None for score, _ in outcomes):
+                break  # budget ran out part-way through this rung
+
+            for params, (score, fit_time) in zip(configs, outcomes):
+                history.append({"rung": rung, "n_samples": n_samples, "params": params,
+                                "score": score, "fit_time": fit_time})
+            ranked = sorted(zip(configs, outcomes), key=lambda item: item[1][0], reverse=True)
+            best_params = ranked[0][0]
+
+            if n_samples >= len(y_fit) or len(configs) == 1:
+                break
+            configs = [params for params, _ in ranked[:max(1, len(configs) // factor)]]
+            n_samples *= factor
+            rung += 1
+
+    return best_params, history
+
+
+def _race_fit(model, X_fit, y_fit, X_val, y_val, is_classification, n_threads=None):
+    """
+    Fits a copy of model on a subsample and scores it on the held-out fold,
+    with at most n_threads OpenMP threads (None: no limit).
+    Returns: per-row losses (0/1 errors or squared errors; None if the fit failed), fit_time
+    """
+    start = time.perf_counter()
+    try:
+        with threadpool_limits(limits=n_threads, user_api="openmp"):
+            predictions = clone(model).fit(X_fit, y_fit).predict(X_val)
+    except ValueError:
+        # e.g. a small subsample that contains a single class
+        return None, time.perf_counter() - start
+    if is_classification:
+        losses = (predictions != y_val).astype(np.float64)
+    else:
+        losses = (predictions.astype(np.float64) - y_val) ** 2
+    return losses, time.perf_counter() - start
+
+
+def _race_score(losses, y_val, is_classification):
+    """
+    Turns per-row losses into the metric evaluate_models reports (accuracy or R²).
+    """
+    if is_classification:
+        return float(1 - losses.mean())
+    total = ((y_val - y_val.mean()) ** 2).sum()
+    return float(1 - losses.sum() / total) if total else float(losses.sum() == 0)
+
+
+def race_candidates(models, X, y, fractions=RACING_FRACTIONS, alpha=RACING_ALPHA, min_rows=RACING_MIN_ROWS,
+                    deadline=None, inputs=None, cores=None, random_state=42):
+    """
+    Learning-curve racing between model families.
+    Each round fits every remaining candidate on a growing fraction of (X, y)
+    and scores it on the same held-out fold. A candidate whose per-row losses
+    are worse than the round leader's in a one-sided paired t-test (p < alpha)
+    is dropped. Rounds are raced up to the last fraction below 1.0; the full
+    fit of the survivors is left to the caller. Rounds with fewer than
+    min_rows rows are skipped, and racing stops once one candidate is left.
+    inputs maps candidate names to their own copy of X (e.g. binned), which
+    is split and subsampled into the same rows. cores (from _allocate_cores)
+    caps each candidate's OpenMP threads.
+    Returns: race dict (rounds, curves per candidate, eliminated, ...), or None if no round ran
+    """
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=0.2, random_state=random_state)
+    # Same size and seed, so every copy is split into the same rows
+    splits = {name: train_test_split(matrix, test_size=0.2, random_state=random_state)
+              for name, matrix in (inputs or {}).items()}
+    is_classification = y.dtype == "object"
+    y_val = np.asarray(y_val) if is_classification else np.asarray(y_val, dtype=np.float64)
+    order = np.random.RandomState(random_state).permutation(len(y_fit))
+    candidates = dict(models)
+    alive = list(candidates)
+    race = {"rounds": [], "curves": {name: [] for name in alive}, "eliminated": {},
+            "alpha": alpha, "validation_rows": len(y_val), "full_rows": len(y)}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=len(alive)) as executor:
+        for fraction in fractions:
+            n_samples = int(len(y_fit) * fraction)
+            if fraction >= 1 or len(alive) < 2 or (deadline is not None and time.monotonic() > deadline):
+                break
+            if n_samples < min_rows:
+                continue
+            idx = order[:n_samples]
+            y_round = y_fit.iloc[idx] if hasattr(y_fit, "iloc") else y_fit[idx]
+
+            def fit_round(name):
+                X_name_fit, X_name_val = splits.get(name, (X_fit, X_val))
+                return _race_fit(candidates[name], X_name_fit[idx], y_round, X_name_val, y_val, is_classification,
+                                 n_threads=(cores or {}).get(name))
+
+            outcomes = dict(zip(alive, executor.map(fit_round, alive)))
+
+            losses = {name: loss for name, (loss, _) in outcomes.items() if loss is not None}
+            for name, (loss, fit_time) in outcomes.items():
+                score = _race_score(loss, y_val, is_classification) if loss is not None else None
+                race["curves"][name].append({"n_samples": n_samples, "score": score, "fit_time": fit_time})
+            race["rounds"].append({"fraction": fraction, "n_samples": n_samples})
+            if not losses:
+                continue
+
+            leader = min(losses, key=lambda name: losses[name].mean())
+            for name, loss in losses.items():
+                if name == leader:
+                    continue
+                # Identical losses give a zero-variance difference and a nan p-value: keep the candidate
+                with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    p_value = ttest_rel(loss, losses[leader], alternative="greater").pvalue
+                if p_value < alpha:
+                    race["eliminated"][name] = {"n_samples": n_samples, "leader": leader, "p_value": float(p_value)}
+            alive = [name for name in alive if name not in race["eliminated"]]
+
+    race["race_time"] = time.perf_counter() - start
+    return race if race["rounds"] else None
+
+
+def train_models(X, y, dataset_name, time_budget=TRAINING_TIME_BUDGET, n_jobs=None,
+                 search_budget=SEARCH_TIME_BUDGET, racing=RACING, progress=None):
+    """
+    Fits every candidate model at once on a thread pool, spreading the
+    available cores (n_jobs, default all) across them; run_agent passes each
+    pipeline its share of the machine.
+    Candidates that haven't finished within time_budget seconds are skipped;
+    if none has finished by then, the first one to finish is kept.
+    With search_budget (seconds) set, each model family in SEARCH_SPACES is
+    first tuned with successive_halving on the training split.
+    With racing, candidates first race on growing subsamples (race_candidates)
+    and only those not clearly behind the leader get the full fit.
+    Histogram gradient boosting (dense input only) trains on a FeatureBinner
+    copy of the training split, binned once and shared by all its fits, and is
+    returned as a Pipeline of that binner and the fitted model.
+    Returns: list of tuples (dataset_name, model_name, model, X_test, y_test, info)
+    where info["fit_time"] is the fit time in seconds, info["search_history"]
+    the search trials, if a search ran, info["race"] the race (shared by
+    all survivors, including the curves of eliminated candidates), if one ran,
+    and info["binning_time"] / info["n_iter"] the shared binning time and
+    boosting iterations kept by early stopping, for gradient boosting.
+    progress, if given, is called with a message as each model finishes.
+    """
     print(f"\nTraining models for dataset: {dataset_name}\n")
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train, X_test, y_train, y_test = split_train_test(X, y)
 
     # Decide models based on target type
     if y.dtype != "object":
         models = [
             ("Linear Regression", LinearRegression()),
-            ("Random Forest Regressor", RandomForestRegressor())
+            ("Random Forest Regressor", RandomForestRegressor()),
+            ("Histogram Gradient Boosting Regressor",
+             HistGradientBoostingRegressor(max_iter=HGB_MAX_ITER, early_stopping=True, random_state=42)),
         ]
     else:
         models = [
             ("Logistic Regression", LogisticRegression(max_iter=1000)),
-            ("Random Forest Classifier", RandomForestClassifier())
+            ("Random Forest Classifier", RandomForestClassifier()),
+            ("Histogram Gradient Boosting Classifier",
+             HistGradientBoostingClassifier(max_iter=HGB_MAX_ITER, early_stopping=True, random_state=42)),
         ]
+    if sparse.issparse(X_train):
+        # Binning works column by column on dense data; the sparse encoding keeps the other families
+        models = [(name, model) for name, model in models if name not in BINNED_MODELS]
+
+    infos = {name: {} for name, _ in models}
+    inputs = {}
+    binned = [name for name, _ in models if name in BINNED_MODELS]
+    if binned:
+        start = time.perf_counter()
+        with span("feature_binning", input_shape=shape_of(X_train)):
+            binner = FeatureBinner().fit(X_train)
+            X_binned = binner.transform(X_train)
+        binning_time = time.perf_counter() - start
+        for name in binned:
+            inputs[name] = X_binned
+            infos[name]["binning_time"] = binning_time
+        print(f" Binned {X_train.shape[1]} features into at most {binner.max_bins} bins in {binning_time:.2f}s")
+    searchable = [(name, model) for name, model in models if name in SEARCH_SPACES]
+    for name, model in searchable if search_budget else []:
+        start = time.perf_counter()
+        with span(f"search: {name}", input_shape=shape_of(X_train)) as attrs:
+            best_params, history = successive_halving(
+                model, SEARCH_SPACES[name], inputs.get(name, X_train), y_train,
+                time_budget=search_budget / len(searchable), n_jobs=n_jobs,
+            )
+            attrs["trials"] = len(history)
+        model.set_params(**best_params)
+        infos[name].update({
+            "search_history": history,
+            "best_params": best_params,
+            "search_time": time.perf_counter() - start,
+        })
+        print(f" {name} search: {len(history)} trials, best {best_params}")
+        if progress:
+            progress(f"{name} search finished: {len(history)} trials")
+
+    cores = _allocate_cores(models, n_jobs or os.cpu_count() or 1)
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    race = None
+    if racing and len(models) > 1:
+        with span("racing", input_shape=shape_of(X_train)) as attrs:
+            race = race_candidates(models, X_train, y_train, deadline=deadline, inputs=inputs, cores=cores)
+            attrs["eliminated"] = len(race["eliminated"]) if race else 0
+    if race:
+        for name, elimination in race["eliminated"].items():
+            message = (f"{name} dropped after {elimination['n_samples']} rows: behind "
+                       f"{elimination['leader']} (p={elimination['p_value']:.3g})")
+            print(f" {message}")
+            if progress:
+                progress(message)
+        models = [(name, model) for name, model in models if name not in race["eliminated"]]
+        for name, _ in models:
+            infos[name]["race"] = race
+        # The survivors share the cores the dropped candidates would have used
+        cores = _allocate_cores(models, n_jobs or os.cpu_count() or 1)
+
+    def fit(name, model):
+        with span(f"fit: {name}", input_shape=shape_of(X_train)), \
+                threadpool_limits(limits=cores[name], user_api="openmp"):
+            fit_time = _timed_fit(model, inputs.get(name, X_train), y_train, deadline)
+        if progress:
+            progress(f"{name} trained in {fit_time:.2f}s")
+        return fit_time
+
+    executor = ThreadPoolExecutor(max_workers=len(models))
+    futures = {executor.submit(fit, name, model): name for name, model in models}
+    done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+    while not_done and not any(f.exception() is None for f in done):
+        finished, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+        done |= finished
+
+    # Don't wait for stragglers: queued fits are cancelled and staged ensembles
+    # stop at their next stage once past the deadline.
+    executor.shutdown(wait=False, cancel_futures=True)
 
     trained_models = []
 
-    for name, model in models:
-        model.fit(X_train, y_train)
-        trained_models.append((dataset_name, name, model, X_test, y_test))
-        print(f" {name} trained")
+    for future, name in futures.items():
+        model = dict(models)[name]
+        if future not in done or isinstance(future.exception(), TimeoutError):
+            print(f" {name} skipped: exceeded the {time_budget}s training budget")
+            continue
+        fit_time = future.result()
+        infos[name]["fit_time"] = fit_time
+        if name in inputs:
+            infos[name]["n_iter"] = model.n_iter_
+            # Predictions start from the preprocessed matrix, so the fitted binner goes in front
+            model = Pipeline([("binner", binner), ("model", model)])
+        trained_models.append((dataset_name, name, model, X_test, y_test, infos[name]))
+        print(f" {name} trained in {fit_time:.2f}s")
+
+    if not trained_models:
+        raise RuntimeError(f"No model finished within the {time_budget}s training budget")
 
-    return trained_models
\ No newline at end of file
+    return trained_models
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+
+from config import RUNS_DIR, RUN_MAX_AGE_DAYS, RUN_MAX_TOTAL_MB
+
+RUN_FILE = "run.json"
+LATEST_FILE = "latest.json"
+
+
+def safe_name(dataset_name):
+    return dataset_name.replace(" ", "_").lower()
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Yields a temporary path next to path to write to; when the block
+    finishes without error the file is renamed over path in one step, so
+    readers see either the old file or the complete new one.
+    The temporary name keeps path's extension (savefig picks the format from it).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}_{threading.get_ident()}.tmp{extension}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_json(path, payload):
+    with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(payload, f, indent=2, default=str)
+
+
+def append_text(path, text):
+    """
+    Appends text to a file by writing the combined content to a new file and
+    renaming it into place, so a concurrent reader never sees half a section.
+    """
+    try:
+        with open(path, "r") as f:
+            text = f.read() + text
+    except FileNotFoundError:
+        pass
+    with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+        f.write(text)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def start_run(dataset_name, runs_dir=RUNS_DIR):
+    """
+    Creates a private directory for one pipeline run of a dataset:
+    runs/<dataset>/<run id>/ with eda_charts/, reports/ and models/ inside,
+    laid out like the shared top-level folders.
+    Returns: run dict (run_id, dataset_name, dir, output_base, reports_dir, models_dir, status, started_at)
+    """
+    run_id = datetime.now().strftime('%Y%m%d_%H%M%S_') + uuid.uuid4().hex[:6]
+    run_dir = os.path.join(runs_dir, safe_name(dataset_name), run_id)
+    run = {
+        "run_id": run_id,
+        "dataset_name": dataset_name,
+        "dir": run_dir,
+        "output_base": os.path.join(run_dir, "eda_charts"),
+        "reports_dir": os.path.join(run_dir, "reports"),
+        "models_dir": os.path.join(run_dir, "models"),
+        "status": "running",
+        "started_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    for folder in (run["output_base"], run["reports_dir"], run["models_dir"]):
+        os.makedirs(folder)
+    write_json(os.path.join(run_dir, RUN_FILE), run)
+    return run
+
+
+def finish_run(run, status="ok"):
+    """
+    Records how a run ended. A successful run is published by pointing its
+    dataset's latest.json at it, so readers switch over in one rename.
+    Returns: the updated run dict
+    """
+    run = dict(run, status=status, finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    write_json(os.path.join(run["dir"], RUN_FILE), run)
+    if status == "ok":
+        write_json(os.path.join(os.path.dirname(run["dir"]), LATEST_FILE), {"run_id": run["run_id"]})
+    return run
+
+
+@contextlib.contextmanager
+def run_workspace(dataset_name, runs_dir=RUNS_DIR):
+    """
+    Starts a run, yields it, and finishes it as "ok" or "failed".
+    """
+    run = start_run(dataset_name, runs_dir)
+    try:
+        yield run
+    except BaseException:
+        finish_run(run, "failed")
+        raise
+    finish_run(run)
+
+
+def load_run(run_dir):
+    """
+    Returns: the run dict saved in run_dir, or None
+    """
+    return _read_json(os.path.join(run_dir, RUN_FILE)) if run_dir else None
+
+
+def latest_run(dataset_name, runs_dir=RUNS_DIR):
+    """
+    Returns: the dataset's most recently published run, or None
+    """
+    dataset_dir = os.path.join(runs_dir, safe_name(dataset_name))
+    pointer = _read_json(os.path.join(dataset_dir, LATEST_FILE))
+    return load_run(os.path.join(dataset_dir, pointer["run_id"])) if pointer else None
+
+
+def output_paths(dataset_name, run=None, runs_dir=RUNS_DIR):
+    """
+    Where a run wrote a dataset's report and charts; defaults to the latest
+    published run, then to the shared folders used before runs existed.
+    Returns: dict with report, pre_training and post_training paths
+    """
+    run = run or latest_run(dataset_name, runs_dir)
+    output_base, reports_dir = (run["output_base"], run["reports_dir"]) if run else ("eda_charts", "reports")
+    name = safe_name(dataset_name)
+    return {
+        "report": os.path.join(reports_dir, f"{name}_report.txt"),
+        "pre_training": os.path.join(output_base, name, "pre_training"),
+        "post_training": os.path.join(output_base, name, "post_training"),
+    }
+
+
+def link_tree(source, target):
+    """
+    Copies a folder of outputs into a new run, hard-linking files where the
+    filesystem allows so unchanged charts cost no space.
+    Returns: False if source no longer exists
+    """
+    if not os.path.isdir(source):
+        return False
+    os.makedirs(target, exist_ok=True)
+    for file_name in os.listdir(source):
+        src, dst = os.path.join(source, file_name), os.path.join(target, file_name)
+        if not os.path.isfile(src) or os.path.exists(dst):
+            continue
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+    return True
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return total
+
+
+def list_runs(runs_dir=RUNS_DIR):
+    """
+    Returns: run dicts of every dataset (oldest first) with their size in bytes and whether they are latest
+    """
+    runs = []
+    if not os.path.isdir(runs_dir):
+        return runs
+    for dataset in sorted(os.listdir(runs_dir)):
+        dataset_dir = os.path.join(runs_dir, dataset)
+        if not os.path.isdir(dataset_dir):
+            continue
+        pointer = _read_json(os.path.join(dataset_dir, LATEST_FILE)) or {}
+        for run_id in os.listdir(dataset_dir):
+            run_dir = os.path.join(dataset_dir, run_id)
+            if not os.path.isdir(run_dir):
+                continue
+            run = load_run(run_dir) or {"run_id": run_id, "dir": run_dir, "status": "unknown"}
+            # run.json is rewritten when a run finishes, so its mtime is the run's last activity
+            marker = os.path.join(run_dir, RUN_FILE)
+            run["modified"] = os.path.getmtime(marker if os.path.exists(marker) else run_dir)
+            run["size"] = _dir_size(run_dir)
+            run["latest"] = run_id == pointer.get("run_id")
+            runs.append(run)
+    return sorted(runs, key=lambda run: run["modified"])
+
+
+def cleanup_runs(runs_dir=RUNS_DIR, max_age_days=RUN_MAX_AGE_DAYS, max_total_mb=RUN_MAX_TOTAL_MB):
+    """
+    Deletes runs older than max_age_days, then the oldest remaining ones
+    until all runs fit in max_total_mb. A dataset's latest run is never
+    deleted, nor a run still in progress unless it is past max_age_days (its process died).
+    Returns: list of deleted run directories
+    """
+    runs = list_runs(runs_dir)
+    total = sum(run["size"] for run in runs)
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for run in runs:
+        expired = run["modified"] < cutoff
+        if run["latest"] or not (expired or total > max_total_mb * 1024 * 1024):
+            continue
+        if run["status"] == "running" and not expired:
+            continue
+        shutil.rmtree(run["dir"], ignore_errors=True)
+        total -= run["size"]
+        removed.append(run["dir"])
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or clean up per-run workspaces.")
+    parser.add_argument("--cleanup", action="store_true", help="Delete old runs (see cleanup_runs)")
+    parser.add_argument("--max-age-days", type=float, default=RUN_MAX_AGE_DAYS)
+    parser.add_argument("--max-total-mb", type=float, default=RUN_MAX_TOTAL_MB)
+    args = parser.parse_args()
+    if args.cleanup:
+        for run_dir in cleanup_runs(max_age_days=args.max_age_days, max_total_mb=args.max_total_mb):
+            print(f"Deleted {run_dir}")
+    for run in list_runs():
+        print(f"{run.get('dataset_name', ''):<32} {run['run_id']:<24} {run['status']:<8} "
+              f"{run['size'] / 1024 ** 2:>9.1f} MB{'  latest' if run['latest'] else ''}")